@@ -0,0 +1,232 @@
+import atexit
+import itertools
+import json
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import metrics
+from paths import DATA_DIR
+
+AUDIT_DIR = DATA_DIR / "audit"
+
+# Single JSON array used before the append-only log; migrated on startup
+LEGACY_AUDIT_LOG_FILE = DATA_DIR / "audit_log.json"
+
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "1"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_MAX_SEGMENT_BYTES = int(os.getenv("AUDIT_MAX_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+
+# audit-YYYY-MM-DD.jsonl, then audit-YYYY-MM-DD.1.jsonl, ... once a day's
+# segment reaches AUDIT_MAX_SEGMENT_BYTES
+SEGMENT_PATTERN = re.compile(r"^audit-(\d{4}-\d{2}-\d{2})(?:\.(\d+))?\.jsonl$")
+
+
+def _entry_day(entry: Dict) -> str:
+    try:
+        return datetime.fromisoformat(entry["timestamp"]).date().isoformat()
+    except (KeyError, TypeError, ValueError):
+        return datetime.utcnow().date().isoformat()
+
+
+class AuditLog:
+    """
+    Append-only JSONL audit sink.
+
+    append() only enqueues the entry; a background thread writes queued
+    entries in batches to per-day segments, rotating a segment once it reaches
+    max_segment_bytes, and fsyncs at most every flush_interval seconds.
+    Each batch goes to its segment in a single O_APPEND write, so several
+    worker processes can share a segment without interleaving lines.
+    """
+
+    def __init__(self, directory: Path = AUDIT_DIR, flush_interval: float = AUDIT_FLUSH_INTERVAL_SECONDS, batch_size: int = AUDIT_BATCH_SIZE, max_segment_bytes: int = AUDIT_MAX_SEGMENT_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_segment_bytes = max_segment_bytes
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self._fd = None
+        self._file_day = None
+        self._last_fsync = 0.0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def append(self, entry: Dict):
+        """Queue an entry for writing; never blocks on disk I/O"""
+        self.queue.put(entry)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                self._sync(force=True)
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"Failed to write audit log entries: {str(e)}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _segment_path(self, day: str) -> Path:
+        """Current segment for the day, moving to the next index once it is full"""
+        index = 0
+        for path in self.directory.glob(f"audit-{day}*.jsonl"):
+            match = SEGMENT_PATTERN.match(path.name)
+            if match and match.group(1) == day:
+                index = max(index, int(match.group(2) or 0))
+        path = self._segment_name(day, index)
+        if path.exists() and path.stat().st_size >= self.max_segment_bytes:
+            path = self._segment_name(day, index + 1)
+        return path
+
+    def _segment_name(self, day: str, index: int) -> Path:
+        suffix = f".{index}" if index else ""
+        return self.directory / f"audit-{day}{suffix}.jsonl"
+
+    def _write(self, entries: List[Dict]):
+        if not entries:
+            return
+        start = time.perf_counter()
+        with self.lock:
+            for day, day_entries in itertools.groupby(entries, key=_entry_day):
+                if self._fd is None or self._file_day != day or os.fstat(self._fd).st_size >= self.max_segment_bytes:
+                    self._close_file()
+                    self._fd = os.open(self._segment_path(day), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+                    self._file_day = day
+                data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in day_entries).encode("utf-8")
+                while data:
+                    data = data[os.write(self._fd, data):]
+        self._sync()
+        metrics.AUDIT_WRITE_SECONDS.observe(time.perf_counter() - start)
+        metrics.AUDIT_ENTRIES.inc(len(entries))
+
+    def _sync(self, force: bool = False):
+        with self.lock:
+            if self._fd is None:
+                return
+            now = time.monotonic()
+            if force or now - self._last_fsync >= self.flush_interval:
+                os.fsync(self._fd)
+                self._last_fsync = now
+
+    def _close_file(self):
+        if self._fd is not None:
+            os.fsync(self._fd)
+            os.close(self._fd)
+            self._fd = None
+            self._file_day = None
+
+    def flush(self):
+        """Block until every queued entry is written and synced to disk"""
+        self.queue.join()
+        self._sync(force=True)
+
+    def close(self):
+        if self._stopped.is_set():
+            return
+        self.flush()
+        self._stopped.set()
+        self._thread.join(timeout=self.flush_interval + 1)
+        with self.lock:
+            self._close_file()
+
+    def segments(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Path]:
+        """Segments that can hold entries between start and end, oldest first"""
+        selected = []
+        for path in self.directory.glob("audit-*.jsonl"):
+            match = SEGMENT_PATTERN.match(path.name)
+            if not match:
+                continue
+            day = match.group(1)
+            if start is not None and day < start.date().isoformat():
+                continue
+            if end is not None and day > end.date().isoformat():
+                continue
+            selected.append((day, int(match.group(2) or 0), path))
+        return [path for _, _, path in sorted(selected)]
+
+    def iter_entries(self, username: Optional[str] = None, event: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[Dict]:
+        """
+        Iterate over entries matching every given filter, oldest first.
+
+        Only the segments whose day falls within [start, end] are read.
+        Timestamps are naive UTC, as written by the API.
+        """
+        self.flush()
+        # Encoded forms as they appear in the JSON lines
+        username_json = json.dumps(username, ensure_ascii=False) if username is not None else None
+        event_json = json.dumps(event, ensure_ascii=False) if event is not None else None
+        for path in self.segments(start, end):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    # Cheap substring test before parsing the line
+                    if username_json is not None and username_json not in line:
+                        continue
+                    if event_json is not None and event_json not in line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if username is not None and entry.get("username") != username:
+                        continue
+                    if event is not None and entry.get("event") != event:
+                        continue
+                    if start is not None or end is not None:
+                        try:
+                            timestamp = datetime.fromisoformat(entry["timestamp"])
+                        except (KeyError, TypeError, ValueError):
+                            continue
+                        if start is not None and timestamp < start:
+                            continue
+                        if end is not None and timestamp > end:
+                            continue
+                    yield entry
+
+    def query(self, username: Optional[str] = None, event: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None, limit: Optional[int] = None) -> List[Dict]:
+        entries = []
+        for entry in self.iter_entries(username, event, start, end):
+            entries.append(entry)
+            if limit is not None and len(entries) >= limit:
+                break
+        return entries
+
+    def migrate_legacy(self, legacy_file: Path = LEGACY_AUDIT_LOG_FILE):
+        """Rename the old JSON array file to *.migrated, then move its entries into segments"""
+        migrated_file = legacy_file.with_name(legacy_file.name + ".migrated")
+        try:
+            # Renaming first claims the file: with several workers starting at
+            # once, only the one whose rename succeeds migrates the entries
+            legacy_file.rename(migrated_file)
+        except FileNotFoundError:
+            return
+        try:
+            with open(migrated_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except Exception as e:
+            print(f"Could not read legacy audit log {migrated_file}: {str(e)}")
+            return
+        if isinstance(entries, list):
+            self._write(sorted(entries, key=lambda entry: str(entry.get("timestamp", ""))))
+            self._sync(force=True)
+
+
+audit_log = AuditLog()
+audit_log.migrate_legacy()
+atexit.register(audit_log.close)
@@ -1,6 +1,14 @@
+import asyncio
+import hashlib
 import json
 import os
 import secrets
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Dict
 import bcrypt
@@ -8,49 +16,354 @@ from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pathlib import Path
 import jwt
+from identity import build_fingerprint
+from paths import DATA_DIR
 
 # Create data directory if it doesn't exist
-DATA_DIR = Path("data")
 DATA_DIR.mkdir(exist_ok=True)
 
 # Constants
 USERS_DB_FILE = DATA_DIR / "users.json"
 SESSIONS_DB_FILE = DATA_DIR / "sessions.json"
+REVOKED_TOKENS_FILE = DATA_DIR / "revoked_tokens.json"
+AUTH_DB_FILE = DATA_DIR / "auth.db"
 TOKEN_EXPIRY_HOURS = 24
 
+# Storage backend for users and sessions: "sqlite" (safe with several
+# uvicorn workers) or "json" (the original single-process files)
+AUTH_STORE = os.getenv("AUTH_STORE", "sqlite").lower()
+
+USER_FIELDS = ("password", "name", "email", "phone", "dob", "ssn")
+
+# bcrypt is deliberately slow, so hashing and checking run in a bounded
+# thread pool instead of on the event loop
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "4"))
+
+# Verified JWTs are remembered for up to TOKEN_CACHE_TTL_SECONDS (never past
+# their exp); a logout in another worker is seen once the entry expires
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "60"))
+
 # Initialize security
 security = HTTPBearer()
 
-class AuthHandler:
-    def __init__(self):
-        self.secret = "YOUR_SECRET_KEY"  # In production, use a secure secret key
-        self.algorithm = "HS256"
+class UserStore(ABC):
+    """Storage backend for AuthHandler users and sessions"""
+
+    @abstractmethod
+    def get_user(self, username: str) -> Optional[Dict]:
+        pass
+
+    @abstractmethod
+    def add_user(self, username: str, user: Dict) -> bool:
+        """Insert a user; returns False if the username already exists"""
+
+    @abstractmethod
+    def get_session(self, token: str) -> Optional[Dict]:
+        pass
+
+    @abstractmethod
+    def save_session(self, token: str, session: Dict):
+        pass
+
+    @abstractmethod
+    def delete_session(self, token: str):
+        pass
+
+    @abstractmethod
+    def revoke_token(self, token: str, expires_at: float):
+        """Record a logged-out JWT until its exp (epoch seconds)"""
+
+    @abstractmethod
+    def is_revoked(self, token: str) -> bool:
+        pass
+
+def _token_digest(token: str) -> str:
+    """Revoked tokens are stored by hash, never in the clear"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class JSONUserStore(UserStore):
+    """
+    Users and sessions kept in memory and rewritten to JSON files on change.
+
+    Changes are serialized with a lock, since registration and login run on
+    the bcrypt thread pool.
+    """
+
+    def __init__(self, users_file: Path = USERS_DB_FILE, sessions_file: Path = SESSIONS_DB_FILE, revoked_file: Path = REVOKED_TOKENS_FILE):
+        self.lock = threading.Lock()
+        self.users_file = users_file
+        self.sessions_file = sessions_file
+        self.revoked_file = revoked_file
         self.users = self._load_users()
         self.sessions_db = self._load_sessions()
-        
+        self.revoked = self._load_revoked()
+
     def _load_users(self):
         try:
-            with open(USERS_DB_FILE, 'r') as f:
+            with open(self.users_file, 'r') as f:
                 return json.load(f)
         except FileNotFoundError:
             return {}
     
     def _load_sessions(self) -> Dict:
         """Load sessions from JSON file or create if not exists"""
-        if SESSIONS_DB_FILE.exists():
-            with open(SESSIONS_DB_FILE, 'r') as f:
+        if self.sessions_file.exists():
+            with open(self.sessions_file, 'r') as f:
                 return json.load(f)
         return {}
     
+    def _load_revoked(self) -> Dict:
+        if self.revoked_file.exists():
+            with open(self.revoked_file, 'r') as f:
+                return json.load(f)
+        return {}
+
     def _save_users(self):
         """Save users to JSON file"""
-        with open(USERS_DB_FILE, 'w') as f:
+        with open(self.users_file, 'w') as f:
             json.dump(self.users, f, indent=4)
     
     def _save_sessions(self):
         """Save sessions to JSON file"""
-        with open(SESSIONS_DB_FILE, 'w') as f:
+        with open(self.sessions_file, 'w') as f:
             json.dump(self.sessions_db, f, indent=4)
+
+    def get_user(self, username: str) -> Optional[Dict]:
+        return self.users.get(username)
+
+    def add_user(self, username: str, user: Dict) -> bool:
+        with self.lock:
+            if username in self.users:
+                return False
+            self.users[username] = user
+            self._save_users()
+        return True
+
+    def get_session(self, token: str) -> Optional[Dict]:
+        return self.sessions_db.get(token)
+
+    def save_session(self, token: str, session: Dict):
+        with self.lock:
+            self.sessions_db[token] = session
+            self._save_sessions()
+
+    def delete_session(self, token: str):
+        with self.lock:
+            if token in self.sessions_db:
+                del self.sessions_db[token]
+                self._save_sessions()
+
+    def revoke_token(self, token: str, expires_at: float):
+        now = time.time()
+        with self.lock:
+            self.revoked = {digest: exp for digest, exp in self.revoked.items() if exp > now}
+            self.revoked[_token_digest(token)] = expires_at
+            with open(self.revoked_file, 'w') as f:
+                json.dump(self.revoked, f, indent=4)
+
+    def is_revoked(self, token: str) -> bool:
+        return _token_digest(token) in self.revoked
+
+class SQLiteUserStore(UserStore):
+    """
+    Users and sessions in a SQLite database in WAL mode.
+
+    Every process and thread reads the same rows, so several uvicorn workers
+    stay consistent. Each thread keeps its own connection, and sqlite3 caches
+    the prepared statements of each connection, so the per-upload user lookup
+    (GET_USER_SQL) is compiled once per thread.
+    """
+
+    GET_USER_SQL = "SELECT password, name, email, phone, dob, ssn FROM users WHERE username = ?"
+
+    def __init__(self, db_file: Path = AUTH_DB_FILE):
+        self.db_file = db_file
+        self.local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "username TEXT PRIMARY KEY, password TEXT NOT NULL, name TEXT, email TEXT, "
+            "phone TEXT, dob TEXT, ssn TEXT, created_at TEXT)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "token TEXT PRIMARY KEY, username TEXT, expires_at TEXT, data TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_username ON sessions (username)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS revoked_tokens (token_hash TEXT PRIMARY KEY, expires_at REAL)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_file), timeout=10, cached_statements=64)
+            conn.execute("PRAGMA busy_timeout=10000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def get_user(self, username: str) -> Optional[Dict]:
+        row = self._conn().execute(self.GET_USER_SQL, (username,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(USER_FIELDS, row))
+
+    def add_user(self, username: str, user: Dict) -> bool:
+        conn = self._conn()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO users (username, password, name, email, phone, dob, ssn, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (username, *(user.get(field, "") for field in USER_FIELDS), datetime.utcnow().isoformat())
+                )
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def get_session(self, token: str) -> Optional[Dict]:
+        row = self._conn().execute("SELECT data FROM sessions WHERE token = ?", (token,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_session(self, token: str, session: Dict):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (token, username, expires_at, data) VALUES (?, ?, ?, ?)",
+                (token, session.get("username"), session.get("expires_at"), json.dumps(session))
+            )
+
+    def delete_session(self, token: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+
+    def revoke_token(self, token: str, expires_at: float):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM revoked_tokens WHERE expires_at < ?", (time.time(),))
+            conn.execute(
+                "INSERT OR REPLACE INTO revoked_tokens (token_hash, expires_at) VALUES (?, ?)",
+                (_token_digest(token), expires_at)
+            )
+
+    def is_revoked(self, token: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM revoked_tokens WHERE token_hash = ?", (_token_digest(token),)
+        ).fetchone()
+        return row is not None
+
+    def migrate_from_json(self, users_file: Path = USERS_DB_FILE, sessions_file: Path = SESSIONS_DB_FILE):
+        """
+        Import users.json / sessions.json (existing rows win) and rename the
+        files. Safe to run from several workers at once: the inserts are
+        idempotent, and a file another worker already renamed is skipped.
+        """
+        conn = self._conn()
+        users = _load_json_to_migrate(users_file)
+        if users is not None:
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO users (username, password, name, email, phone, dob, ssn, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (username, *(user.get(field, "") for field in USER_FIELDS), datetime.utcnow().isoformat())
+                        for username, user in users.items()
+                    ]
+                )
+            _mark_migrated(users_file)
+        sessions = _load_json_to_migrate(sessions_file)
+        if sessions is not None:
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO sessions (token, username, expires_at, data) VALUES (?, ?, ?, ?)",
+                    [
+                        (token, session.get("username"), session.get("expires_at"), json.dumps(session))
+                        for token, session in sessions.items()
+                    ]
+                )
+            _mark_migrated(sessions_file)
+
+def _load_json_to_migrate(path: Path) -> Optional[Dict]:
+    """Contents of a JSON store file, or None if it is gone (e.g. migrated by another worker)"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _mark_migrated(path: Path):
+    try:
+        path.rename(path.with_name(path.name + ".migrated"))
+    except FileNotFoundError:
+        pass
+
+class TokenCache:
+    """Small LRU of verified JWTs: token -> (username, valid until)"""
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE, ttl_seconds: float = TOKEN_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                return None
+            username, valid_until = entry
+            if time.time() >= valid_until:
+                del self.entries[token]
+                return None
+            self.entries.move_to_end(token)
+            return username
+
+    def put(self, token: str, username: str, exp: float):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[token] = (username, min(exp, time.time() + self.ttl_seconds))
+            self.entries.move_to_end(token)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def discard(self, token: str):
+        with self.lock:
+            self.entries.pop(token, None)
+
+def default_store() -> UserStore:
+    if AUTH_STORE == "json":
+        return JSONUserStore()
+    store = SQLiteUserStore()
+    store.migrate_from_json()
+    return store
+
+class AuthHandler:
+    def __init__(self, store: Optional[UserStore] = None):
+        self.secret = "YOUR_SECRET_KEY"  # In production, use a secure secret key
+        self.algorithm = "HS256"
+        self.store = store or default_store()
+        self.token_cache = TokenCache()
+        # username -> normalized identifiers used by the upload ownership checks
+        self.fingerprints = {}
+        self._fingerprint_lock = threading.Lock()
+        self._hash_pool = None
+        self._hash_pool_lock = threading.Lock()
+
+    def _get_hash_pool(self) -> ThreadPoolExecutor:
+        with self._hash_pool_lock:
+            if self._hash_pool is None:
+                self._hash_pool = ThreadPoolExecutor(max_workers=AUTH_HASH_WORKERS, thread_name_prefix="bcrypt")
+            return self._hash_pool
+
+    async def _run_hash(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_hash_pool(), func, *args)
     
     def get_user_data(self, username: str) -> dict:
         """
@@ -62,10 +375,10 @@ class AuthHandler:
         Returns:
             dict: User data including name, email, phone, dob, and ssn
         """
-        if username not in self.users:
+        user = self.store.get_user(username)
+        if user is None:
             return None
             
-        user = self.users[username]
         return {
             "name": user.get("name", ""),
             "email": user.get("email", ""),
@@ -74,6 +387,20 @@ class AuthHandler:
             "ssn": user.get("ssn", "")
         }
     
+    def get_user_fingerprint(self, username: str) -> Optional[Dict]:
+        """Normalized identifiers of the user (see identity.build_fingerprint), cached per username"""
+        with self._fingerprint_lock:
+            fingerprint = self.fingerprints.get(username)
+        if fingerprint is not None:
+            return fingerprint
+        user_data = self.get_user_data(username)
+        if user_data is None:
+            return None
+        fingerprint = build_fingerprint(user_data)
+        with self._fingerprint_lock:
+            self.fingerprints[username] = fingerprint
+        return fingerprint
+    
     def verify_password(self, plain_password, hashed_password):
         return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
     
@@ -94,13 +421,15 @@ class AuthHandler:
         )
     
     def decode_token(self, token):
+        username = self.token_cache.get(token)
+        if username is not None:
+            return username
         try:
             payload = jwt.decode(
                 token,
                 self.secret,
                 algorithms=[self.algorithm]
             )
-            return payload['sub']
         except jwt.ExpiredSignatureError:
             raise HTTPException(
                 status_code=401,
@@ -111,51 +440,75 @@ class AuthHandler:
                 status_code=401,
                 detail='Invalid token'
             )
+        if self.store.is_revoked(token):
+            raise HTTPException(
+                status_code=401,
+                detail='Token has been revoked'
+            )
+        self.token_cache.put(token, payload['sub'], payload['exp'])
+        return payload['sub']
     
     def register_user(self, username: str, password: str, user_data: dict):
-        if username in self.users:
+        if self.store.get_user(username) is not None:
             raise HTTPException(
                 status_code=400,
                 detail='Username already exists'
             )
         
         hashed_password = self.get_password_hash(password)
-        self.users[username] = {
+        added = self.store.add_user(username, {
             "password": hashed_password,
             "name": user_data.get("name", ""),
             "email": user_data.get("email", ""),
             "phone": user_data.get("phone", ""),
             "dob": user_data.get("dob", ""),
             "ssn": user_data.get("ssn", "")
-        }
-        self._save_users()
+        })
+        # Another worker may have registered the same name in the meantime
+        if not added:
+            raise HTTPException(
+                status_code=400,
+                detail='Username already exists'
+            )
         return {"message": "User registered successfully"}
+
+    async def aregister_user(self, username: str, password: str, user_data: dict):
+        """register_user with the bcrypt work in the hash pool"""
+        return await self._run_hash(self.register_user, username, password, user_data)
     
     def authenticate_user(self, username: str, password: str):
-        if username not in self.users:
+        user = self.store.get_user(username)
+        if user is None:
             return False
-        if not self.verify_password(password, self.users[username]["password"]):
+        if not self.verify_password(password, user["password"]):
             return False
         return True
+
+    async def aauthenticate_user(self, username: str, password: str):
+        """authenticate_user with the bcrypt work in the hash pool"""
+        return await self._run_hash(self.authenticate_user, username, password)
     
     def verify_token(self, token: str) -> Dict:
         """Verify session token and return user info"""
-        if token not in self.sessions_db:
+        session = self.store.get_session(token)
+        if session is None:
             raise HTTPException(status_code=401, detail="Invalid token")
         
-        session = self.sessions_db[token]
         if datetime.fromisoformat(session["expires_at"]) < datetime.now():
-            del self.sessions_db[token]
-            self._save_sessions()
+            self.store.delete_session(token)
             raise HTTPException(status_code=401, detail="Token expired")
         
         return session
     
     def logout(self, token: str):
-        """Invalidate session token"""
-        if token in self.sessions_db:
-            del self.sessions_db[token]
-            self._save_sessions()
+        """Invalidate session token and revoke the JWT until it expires"""
+        self.store.delete_session(token)
+        self.token_cache.discard(token)
+        try:
+            payload = jwt.decode(token, self.secret, algorithms=[self.algorithm])
+        except jwt.InvalidTokenError:
+            return
+        self.store.revoke_token(token, payload['exp'])
 
 # Create global auth handler instance
 auth_handler = AuthHandler()
@@ -164,7 +517,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     """Dependency to get current authenticated user"""
     try:
         username = auth_handler.decode_token(credentials.credentials)
-        return {"username": username}
+        return {"username": username, "token": credentials.credentials}
     except HTTPException as e:
         raise e
     except Exception as e:
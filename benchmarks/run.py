@@ -0,0 +1,204 @@
+"""
+Offline benchmarks for extraction, de-identification and the /upload pipeline.
+
+Run from the repository root:
+
+    python -m benchmarks.run                      # time and write results JSON
+    python -m benchmarks.run --save-baseline      # also store them as the baseline
+    python -m benchmarks.run --threshold 0.15     # fail on >15% median regressions
+
+Everything runs in a temporary working directory, so the benchmark never
+touches ./data. Gemini/Groq are replaced by a stub with --llm-latency seconds
+of simulated latency.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BENCHMARKS_DIR = REPO_ROOT / "benchmarks"
+DEFAULT_RESULTS_DIR = BENCHMARKS_DIR / "results"
+DEFAULT_BASELINE = BENCHMARKS_DIR / "baseline.json"
+DEFAULT_THRESHOLD = 0.20
+
+BENCHMARK_USERNAME = "benchmark"
+BENCHMARK_PASSWORD = "benchmark-password"
+
+
+def _prepare_environment(workdir: str):
+    """Isolate the run; must happen before any pipeline module is imported"""
+    os.chdir(workdir)
+    if str(REPO_ROOT) not in sys.path:
+        sys.path.insert(0, str(REPO_ROOT))
+    # Repeated runs must measure the pipeline, not the caches
+    os.environ["RESULT_CACHE_ENABLED"] = "false"
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def _summarize(samples):
+    return {
+        "runs": len(samples),
+        "min_ms": round(min(samples) * 1000, 3),
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3)
+    }
+
+
+async def _run_upload(upload, file_upload, current_user):
+    """Drive the /upload event_stream to completion; returns the final event"""
+    response = await upload(file_upload, current_user)
+    last = None
+    async for line in response.body_iterator:
+        last = json.loads(line)
+    return last
+
+
+def run_benchmarks(scenarios, repeat, llm_latency):
+    from benchmarks.synthetic import SCENARIOS, BENCHMARK_PATIENT, generate_cbc_pdf
+    from benchmarks.stub_llm import install_stub_llm
+    from extract import extract_pdf_content
+    from deidentify import deidentify_text, process_table_data, process_json_file
+    from auth import auth_handler
+    import main
+
+    install_stub_llm(llm_latency)
+    if auth_handler.get_user_data(BENCHMARK_USERNAME) is None:
+        auth_handler.register_user(BENCHMARK_USERNAME, BENCHMARK_PASSWORD, BENCHMARK_PATIENT)
+    current_user = {"username": BENCHMARK_USERNAME}
+
+    results = {}
+    loop = asyncio.new_event_loop()
+    try:
+        for name in scenarios:
+            params = SCENARIOS[name]
+            pdf_bytes = generate_cbc_pdf(seed=len(name), **params)
+            file_upload = main.FileUpload(file_data=base64.b64encode(pdf_bytes).decode())
+            extraction, _ = extract_pdf_content(pdf_bytes, parallel=False)
+            json_in = Path(f"{name}_extraction.json")
+            json_out = Path(f"{name}_deidentified.json")
+            with open(json_in, 'w', encoding='utf-8') as f:
+                json.dump(extraction, f)
+
+            stages = {
+                "extract_pdf_content": lambda: extract_pdf_content(pdf_bytes, parallel=False),
+                "deidentify_text": lambda: deidentify_text(extraction["text"]),
+                "process_table_data": lambda: [process_table_data(table["data"]) for table in extraction["tables"]],
+                "process_json_file": lambda: process_json_file(str(json_in), str(json_out)),
+                "upload_event_stream": lambda: loop.run_until_complete(_run_upload(main.upload, file_upload, current_user))
+            }
+            for stage, func in stages.items():
+                # One untimed warm-up run (worker pools, spaCy caches)
+                _, outcome = _timed(func)
+                if stage == "upload_event_stream" and not (outcome or {}).get("done"):
+                    raise RuntimeError(f"Upload pipeline failed for {name}: {outcome}")
+                samples = [_timed(func)[0] for _ in range(repeat)]
+                results[f"{name}/{stage}"] = _summarize(samples)
+                print(f"{name:>10} {stage:<22} median {results[f'{name}/{stage}']['median_ms']:>10.1f} ms")
+    finally:
+        loop.run_until_complete(main.shutdown())
+        loop.close()
+    return results
+
+
+def _versions():
+    versions = {"python": platform.python_version()}
+    for module in ("fitz", "spacy", "langchain_core", "fastapi"):
+        try:
+            imported = __import__(module)
+        except ImportError:
+            continue
+        versions[module] = getattr(imported, "__version__", None) or getattr(imported, "VersionBind", None)
+    return versions
+
+
+def compare(results, baseline, threshold):
+    """Return (benchmark, baseline ms, current ms, change) for every median over the threshold"""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get("results", {}).get(key)
+        if not previous or not previous.get("median_ms"):
+            continue
+        change = current["median_ms"] / previous["median_ms"] - 1
+        if change > threshold:
+            regressions.append((key, previous["median_ms"], current["median_ms"], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", help="Scenarios to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark (default: 5)")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated seconds per stub LLM call")
+    parser.add_argument("--output", type=Path, help="Results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="Baseline to compare against")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("BENCHMARK_REGRESSION_THRESHOLD", DEFAULT_THRESHOLD)), help="Allowed median slowdown as a fraction (default: 0.20)")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to the baseline file")
+    args = parser.parse_args(argv)
+
+    output = (args.output or DEFAULT_RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json").resolve()
+    baseline_path = args.baseline.resolve()
+
+    with tempfile.TemporaryDirectory(prefix="hipaa-bench-") as workdir:
+        cwd = os.getcwd()
+        _prepare_environment(workdir)
+        from benchmarks.synthetic import SCENARIOS
+        scenarios = args.scenarios or list(SCENARIOS)
+        unknown = [name for name in scenarios if name not in SCENARIOS]
+        if unknown:
+            parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+        try:
+            results = run_benchmarks(scenarios, args.repeat, args.llm_latency)
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "platform": platform.platform(),
+        "versions": _versions(),
+        "repeat": args.repeat,
+        "llm_latency": args.llm_latency,
+        "results": results
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    print(f"Results written to {output}")
+
+    if args.save_baseline:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+        print(f"Baseline written to {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path}; run with --save-baseline to create one")
+        return 0
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for key, previous, current, change in regressions:
+        print(f"REGRESSION {key}: {previous:.1f} ms -> {current:.1f} ms (+{change:.0%})")
+    if regressions:
+        return 1
+    print(f"No regressions over {args.threshold:.0%} against {baseline_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
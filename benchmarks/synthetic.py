@@ -0,0 +1,134 @@
+"""Synthetic CBC-style lab report PDFs for the benchmarks."""
+import random
+from typing import Dict, Optional
+
+import fitz
+
+# Patient the end-to-end benchmark user is registered as, so the PHI
+# ownership check passes
+BENCHMARK_PATIENT = {
+    "name": "Jordan Avery",
+    "email": "jordan.avery@example.com",
+    "phone": "415-555-0142",
+    "dob": "1984-03-17",
+    "ssn": "521-44-9087"
+}
+
+FIRST_NAMES = ["Maria", "James", "Priya", "Wei", "Fatima", "Lucas", "Amara", "Noah", "Elena", "Kenji"]
+LAST_NAMES = ["Garcia", "Okafor", "Sharma", "Chen", "Haddad", "Novak", "Mensah", "Brooks", "Rossi", "Tanaka"]
+CITIES = ["Springfield", "Riverside", "Fairview", "Madison", "Georgetown", "Clinton"]
+
+# (test, unit, low, high) of a complete blood count
+CBC_TESTS = [
+    ("Hemoglobin", "g/dL", 12.0, 17.5),
+    ("Hematocrit", "%", 36.0, 50.0),
+    ("RBC Count", "mill/cumm", 4.2, 5.9),
+    ("WBC Count", "cells/cumm", 4000, 11000),
+    ("Platelet Count", "lakhs/cumm", 1.5, 4.5),
+    ("MCV", "fL", 80.0, 100.0),
+    ("MCH", "pg", 27.0, 33.0),
+    ("MCHC", "g/dL", 32.0, 36.0),
+    ("RDW", "%", 11.5, 14.5),
+    ("Neutrophils", "%", 40.0, 75.0),
+    ("Lymphocytes", "%", 20.0, 45.0),
+    ("Monocytes", "%", 2.0, 10.0),
+    ("Eosinophils", "%", 1.0, 6.0),
+    ("Basophils", "%", 0.0, 1.0),
+    ("ESR", "mm/hr", 0.0, 20.0)
+]
+
+# Benchmark cases: page count, bordered tables per page and extra PHI lines
+# (other people's names, phones, SSNs, ...) per page
+SCENARIOS = {
+    "small": {"pages": 1, "tables_per_page": 1, "phi_lines": 2},
+    "medium": {"pages": 5, "tables_per_page": 2, "phi_lines": 6},
+    "large": {"pages": 20, "tables_per_page": 2, "phi_lines": 12},
+    "text_only": {"pages": 10, "tables_per_page": 0, "phi_lines": 20},
+    "phi_dense": {"pages": 5, "tables_per_page": 1, "phi_lines": 40}
+}
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 40
+LINE_HEIGHT = 12
+ROW_HEIGHT = 16
+COLUMN_X = [MARGIN, 200, 290, 380, PAGE_WIDTH - MARGIN]
+
+
+def _fake_person(rng: random.Random) -> Dict[str, str]:
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    return {
+        "name": f"{first} {last}",
+        "email": f"{first.lower()}.{last.lower()}@example.org",
+        "phone": f"({rng.randint(200, 989)}) {rng.randint(200, 999)}-{rng.randint(0, 9999):04d}",
+        "dob": f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{rng.randint(1940, 2010)}",
+        "ssn": f"{rng.randint(100, 899)}-{rng.randint(10, 99)}-{rng.randint(1000, 9999)}"
+    }
+
+
+def _phi_line(rng: random.Random) -> str:
+    person = _fake_person(rng)
+    return rng.choice([
+        f"Referred by Dr. {person['name']}, phone {person['phone']}",
+        f"Emergency contact: {person['name']} ({person['email']})",
+        f"Guarantor SSN {person['ssn']}, DOB: {person['dob']}",
+        f"Sample collected at {rng.choice(CITIES)} on {person['dob']}",
+        f"MRN: MR{rng.randint(100000, 999999)} Reg. no. : {rng.randint(1000, 99999)}"
+    ])
+
+
+def _draw_table(page, rng: random.Random, top: float) -> float:
+    """Draw a ruled CBC table starting at top; returns the y below it"""
+    rows = [("Test", "Result", "Unit", "Reference Range")]
+    for test, unit, low, high in rng.sample(CBC_TESTS, rng.randint(6, len(CBC_TESTS))):
+        value = rng.uniform(low * 0.8, high * 1.2)
+        value = f"{value:.0f}" if high >= 100 else f"{value:.1f}"
+        rows.append((test, value, unit, f"{low:g} - {high:g}"))
+
+    bottom = top + ROW_HEIGHT * len(rows)
+    for index in range(len(rows) + 1):
+        y = top + ROW_HEIGHT * index
+        page.draw_line((COLUMN_X[0], y), (COLUMN_X[-1], y))
+    for x in COLUMN_X:
+        page.draw_line((x, top), (x, bottom))
+    for index, row in enumerate(rows):
+        y = top + ROW_HEIGHT * index + 11
+        for x, cell in zip(COLUMN_X, row):
+            page.insert_text((x + 3, y), cell, fontsize=8)
+    return bottom + LINE_HEIGHT
+
+
+def generate_cbc_pdf(pages: int = 1, tables_per_page: int = 1, phi_lines: int = 2, seed: int = 0, patient: Optional[Dict[str, str]] = None) -> bytes:
+    """
+    Build a lab report PDF with a patient header, ruled CBC tables and extra
+    PHI lines on every page. The same arguments always produce the same PDF.
+    """
+    rng = random.Random(seed)
+    patient = patient or BENCHMARK_PATIENT
+    year, month, day = patient["dob"].split("-")
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        header = [
+            "City Diagnostics Laboratory - Complete Blood Count",
+            f"Patient Name: Mr. {patient['name']}",
+            f"DOB: {month}/{day}/{year}    SSN: {patient['ssn']}",
+            f"Phone: {patient['phone']}    Email: {patient['email']}",
+            f"Age: {rng.randint(20, 80)} years    Page {page_num + 1} of {pages}"
+        ]
+        y = MARGIN
+        for line in header:
+            page.insert_text((MARGIN, y), line, fontsize=9)
+            y += LINE_HEIGHT
+        y += LINE_HEIGHT
+
+        for _ in range(tables_per_page):
+            y = _draw_table(page, rng, y)
+        for _ in range(phi_lines):
+            if y > PAGE_HEIGHT - MARGIN:
+                break
+            page.insert_text((MARGIN, y), _phi_line(rng), fontsize=8)
+            y += LINE_HEIGHT
+
+    data = doc.tobytes()
+    doc.close()
+    return data
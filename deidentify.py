@@ -1,11 +1,45 @@
 import spacy
 import re
+import os
 import json
+import threading
 import time
-from typing import Dict, List, Tuple
+from typing import Dict, List, Tuple, Optional, Any
+from extract import document_text, document_tables
+from identity import normalize
+import metrics
 
-# Load spaCy English model
-nlp = spacy.load("en_core_web_sm")
+# spaCy English model, loaded on first use by get_nlp(). Only NER is needed,
+# so the components it does not depend on are not loaded at all (in
+# en_core_web_sm the NER has its own tok2vec)
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+SPACY_EXCLUDE = [
+    name.strip()
+    for name in os.getenv("SPACY_EXCLUDE", "tok2vec,tagger,parser,senter,attribute_ruler,lemmatizer").split(",")
+    if name.strip()
+]
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+# Small document run through the pipeline by warm_up()
+WARMUP_TEXT = "Patient: Mr. John Smith, DOB: 01/02/1980, Phone: 555-123-4567. Hemoglobin 13.5 g/dl"
+
+def get_nlp():
+    """Load the spaCy model once per process, on first use (thread-safe)"""
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                start = time.perf_counter()
+                _nlp = spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDE)
+                print(f"Loaded spaCy {SPACY_MODEL} ({', '.join(_nlp.pipe_names)}) in {time.perf_counter() - start:.2f}s")
+    return _nlp
+
+def warm_up():
+    """Load the model and run a small document through de-identification"""
+    get_nlp()
+    deidentify_texts([WARMUP_TEXT, "13.5 g/dl"])
 
 # Define custom PHI-like patterns (optional extension to spaCy)
 CUSTOM_PATTERNS = {
@@ -16,17 +50,55 @@ CUSTOM_PATTERNS = {
     "DOB": r"(?:DOB|Date of Birth)[:\s]*\d{1,2}[/-]\d{1,2}[/-]\d{2,4}",
     "AGE": r"\d+\s*(?:YRS|years|yrs)",
     "REG_NO": r"Reg\.\s*no\.\s*:\s*\d+",
-    "DATE": r"\d{1,2}/\d{1,2}/\d{4}",
+    # Also dd-mm-yyyy, yyyy-mm-dd, dd.mm.yyyy and two-digit years, with the
+    # same separator twice so ranges such as "10.5-12.5" are not taken for dates
+    "DATE": r"\d{1,2}/\d{1,2}/\d{4}|(?<!\d)(?:\d{1,2}([-/.])\d{1,2}\1\d{2,4}|\d{4}([-/.])\d{1,2}\2\d{1,2})(?!\d)",
     "NAME_PREFIX": r"(?:Mr\.|Mrs\.|Ms\.|Dr\.)\s+[A-Za-z\s]+"
 }
 
-def extract_phi_info(text: str) -> Dict[str, List[str]]:
-    """Extract PHI information from text and return as a dictionary."""
-    if not isinstance(text, str):
-        return {}
-        
-    doc = nlp(text)
-    phi_info = {
+NER_LABELS = ["PERSON", "GPE", "DATE"]
+
+# CUSTOM_PATTERNS compiled once. Each pattern keeps its own scan: in a single
+# alternation only the first pattern matching at a position is reported, so
+# e.g. a PHONE inside "9876543210@gmail.com" would hide the EMAIL there.
+PHI_PATTERNS = {label: re.compile(pattern) for label, pattern in CUSTOM_PATTERNS.items()}
+
+# Tie-break for overlapping spans that start at the same position and have the
+# same length: regex labels are more specific than the NER ones
+MASK_PRIORITY = {label: index for index, label in enumerate(list(CUSTOM_PATTERNS) + NER_LABELS)}
+
+# Batching for nlp.pipe over table cells
+NLP_BATCH_SIZE = int(os.getenv("NLP_BATCH_SIZE", "256"))
+NLP_N_PROCESS = int(os.getenv("NLP_N_PROCESS", "1"))
+
+# Cells made up only of numbers, ranges and lab units are not sent through NER
+NUMERIC_TOKEN_PATTERN = re.compile(r"^[\d.,:;%+\-<>=/()\[\]^*xX]+$")
+UNIT_TOKENS = {
+    "%", "g/dl", "gm/dl", "gm%", "mg/dl", "ug/dl", "g/l", "mg/l", "mmol/l", "meq/l",
+    "iu/l", "u/l", "ng/ml", "pg/ml", "fl", "pg", "mm/hr", "/hpf", "/ul", "/cumm",
+    "cumm", "cells/cumm", "cells/ul", "lakhs/cumm", "mill/cumm", "million/cumm",
+    "thou/mm3", "mill/mm3", "x10^3/ul", "x10^6/ul", "10^3/ul", "10^6/ul",
+    "x10^9/l", "x10^12/l", "10^9/l", "10^12/l"
+}
+
+# Which phi_info bucket each detected label contributes to
+PHI_INFO_KEYS = {
+    "PERSON": "names",
+    "GPE": "addresses",
+    "DATE": "dates",
+    "DOB": "dates",
+    "PHONE": "phones",
+    "EMAIL": "emails",
+    "SSN": "ssns",
+    "MRN": "mrns"
+}
+
+# Regex labels whose presence, with none of the user's identifiers anywhere in
+# the text, marks a document as clearly someone else's
+OWNERSHIP_IDENTIFIER_LABELS = {"PHONE", "EMAIL", "SSN", "DOB", "DATE"}
+
+def _empty_phi_info() -> Dict[str, List[str]]:
+    return {
         "names": [],
         "phones": [],
         "emails": [],
@@ -36,98 +108,368 @@ def extract_phi_info(text: str) -> Dict[str, List[str]]:
         "addresses": []
     }
 
-    # Extract named entities
+def regex_phi_spans(text: str) -> List[Tuple[int, int, str]]:
+    """Return (start, end, label) spans for every CUSTOM_PATTERNS match."""
+    spans = []
+    for label, pattern in PHI_PATTERNS.items():
+        for match in pattern.finditer(text):
+            spans.append((match.start(), match.end(), label))
+    return spans
+
+def detect_phi_spans(text: str, doc: Optional[Any] = None) -> List[Tuple[int, int, str]]:
+    """
+    Run NER and the custom regex patterns over the text once.
+
+    Args:
+        text: Text to scan
+        doc: Already parsed spaCy doc for the text (e.g. from nlp.pipe)
+
+    Returns:
+        List of (start, end, label) spans, NER entities first followed by
+        regex matches in CUSTOM_PATTERNS order
+    """
+    if doc is None:
+        doc = get_nlp()(text)
+    spans = []
+
+    # Detect named entities (built-in NER)
     for ent in doc.ents:
-        if ent.label_ == "PERSON":
-            clean_name = ent.text.split('\n')[0]
+        if ent.label_ in NER_LABELS:
+            spans.append((ent.start_char, ent.end_char, ent.label_))
+
+    # Apply regex-based PHI detection
+    spans.extend(regex_phi_spans(text))
+
+    return spans
+
+def needs_ner(text: str) -> bool:
+    """Return False for cells that hold only numbers and units, e.g. "13.5" or "g/dL"."""
+    tokens = text.split()
+    if not tokens:
+        return False
+    return not all(
+        NUMERIC_TOKEN_PATTERN.match(token) or token.strip("()[]").lower() in UNIT_TOKENS
+        for token in tokens
+    )
+
+def phi_info_from_spans(text: str, spans: List[Tuple[int, int, str]]) -> Dict[str, List[str]]:
+    """Build the phi_info dictionary from detected spans."""
+    phi_info = _empty_phi_info()
+
+    for start, end, label in spans:
+        key = PHI_INFO_KEYS.get(label)
+        if key is None:
+            continue
+        value = text[start:end]
+        if label == "PERSON":
+            clean_name = value.split('\n')[0]
             # Remove any additional text that might be attached
             clean_name = clean_name.split(' Sample')[0]
             clean_name = clean_name.split(' Age')[0]
             # Only add if it's not empty and not already in the list
             if clean_name and clean_name not in phi_info["names"]:
                 phi_info["names"].append(clean_name)
-        elif ent.label_ == "GPE":
-            phi_info["addresses"].append(ent.text)
-        elif ent.label_ == "DATE":
-            phi_info["dates"].append(ent.text)
-
-    # Extract using regex patterns
-    for label, pattern in CUSTOM_PATTERNS.items():
-        for match in re.finditer(pattern, text):
-            value = match.group()
-            if label == "PHONE":
-                phi_info["phones"].append(value)
-            elif label == "EMAIL":
-                phi_info["emails"].append(value)
-            elif label == "SSN":
-                phi_info["ssns"].append(value)
-            elif label == "MRN":
-                phi_info["mrns"].append(value)
-            elif label in ["DOB", "DATE"]:
-                phi_info["dates"].append(value)
-    
+        else:
+            phi_info[key].append(value)
+
     return phi_info
 
+def resolve_overlaps(spans: List[Tuple[int, int, str]]) -> List[Tuple[int, int, str]]:
+    """
+    Order spans by position and merge any that overlap.
+
+    Overlapping spans collapse into one span covering all of them, labelled by
+    the span that starts first (the longest one, then MASK_PRIORITY, on ties),
+    so no detected character is left unmasked and offsets stay valid.
+    """
+    ordered = sorted(
+        spans,
+        key=lambda span: (span[0], span[0] - span[1], MASK_PRIORITY.get(span[2], len(MASK_PRIORITY)))
+    )
+    resolved = []
+    for start, end, label in ordered:
+        if resolved and start < resolved[-1][1]:
+            previous_start, previous_end, previous_label = resolved[-1]
+            resolved[-1] = (previous_start, max(previous_end, end), previous_label)
+        else:
+            resolved.append((start, end, label))
+    return resolved
+
+def mask_spans(text: str, spans: List[Tuple[int, int, str]]) -> str:
+    """Replace every span in the text with its {{LABEL}} placeholder."""
+    pieces = []
+    position = 0
+    for start, end, label in resolve_overlaps(spans):
+        pieces.append(text[position:start])
+        pieces.append(f"{{{{{label}}}}}")
+        position = end
+    pieces.append(text[position:])
+
+    return "".join(pieces)
+
+def extract_phi_info(text: str) -> Dict[str, List[str]]:
+    """Extract PHI information from text and return as a dictionary."""
+    if not isinstance(text, str):
+        return {}
+
+    return phi_info_from_spans(text, detect_phi_spans(text))
+
 def deidentify_text(text: str) -> Tuple[str, Dict[str, List[str]]]:
     """Deidentify text and return both deidentified text and extracted PHI."""
     if not isinstance(text, str):
         return text, {}
-        
-    doc = nlp(text)
-    spans_to_replace = []
-    people = []
 
-    phi_info = extract_phi_info(text)
+    # A single detection pass feeds both the masked text and phi_info
+    spans = detect_phi_spans(text)
+    return mask_spans(text, spans), phi_info_from_spans(text, spans)
 
-    # Detect named entities (built-in NER)
-    for ent in doc.ents:
-        if ent.label_ in ["PERSON", "GPE", "DATE"]:
-            spans_to_replace.append((ent.start_char, ent.end_char, f"{{{{{ent.label_}}}}}"))
-            if ent.label_ in ["PERSON"]:
-                people.append(ent)
-            
-    # Apply regex-based PHI detection
-    for label, pattern in CUSTOM_PATTERNS.items():
-        for match in re.finditer(pattern, text):
-            spans_to_replace.append((match.start(), match.end(), f"{{{{{label}}}}}"))
+def deidentify_texts(texts: List, batch_size: Optional[int] = None, n_process: Optional[int] = None) -> List[Tuple[Any, Dict[str, List[str]]]]:
+    """
+    Deidentify many strings with a single batched nlp.pipe call.
+
+    Args:
+        texts: Values to deidentify; non-string values are passed through
+        batch_size: nlp.pipe batch size (defaults to NLP_BATCH_SIZE)
+        n_process: nlp.pipe worker processes (defaults to NLP_N_PROCESS)
 
-    # Sort spans in reverse order to avoid messing up indices while replacing
-    spans_to_replace.sort(reverse=True, key=lambda x: x[0])
+    Returns:
+        List of (deidentified value, phi_info) in the same order as texts
+    """
+    results = [None] * len(texts)
+    ner_indices = []
+
+    masking_start = time.perf_counter()
+    for index, text in enumerate(texts):
+        if not isinstance(text, str):
+            results[index] = (text, {})
+        elif needs_ner(text):
+            ner_indices.append(index)
+        else:
+            # Numeric/unit-only cells still go through the regex patterns
+            spans = regex_phi_spans(text)
+            results[index] = (mask_spans(text, spans), phi_info_from_spans(text, spans))
+    masking_seconds = time.perf_counter() - masking_start
 
-    # Replace spans
-    for start, end, replacement in spans_to_replace:
-        text = text[:start] + replacement + text[end:]
+    docs = []
+    if ner_indices:
+        ner_start = time.perf_counter()
+        docs = list(get_nlp().pipe(
+            (texts[index] for index in ner_indices),
+            batch_size=batch_size or NLP_BATCH_SIZE,
+            n_process=n_process or NLP_N_PROCESS
+        ))
+        metrics.NER_SECONDS.observe(time.perf_counter() - ner_start)
 
-    return text, phi_info
+    masking_start = time.perf_counter()
+    for index, doc in zip(ner_indices, docs):
+        text = texts[index]
+        spans = detect_phi_spans(text, doc)
+        results[index] = (mask_spans(text, spans), phi_info_from_spans(text, spans))
+    metrics.REGEX_MASKING_SECONDS.observe(masking_seconds + time.perf_counter() - masking_start)
 
-def process_table_data(table_data: List) -> Tuple[List, Dict[str, List[str]]]:
+    return results
+
+def _collect_cells(tables: List[List]) -> Tuple[List[Tuple[int, int, int]], List[str]]:
+    """Return the (table, row, cell) position and value of every string cell."""
+    positions = []
+    cells = []
+    for table_index, table_data in enumerate(tables):
+        if not isinstance(table_data, list):
+            continue
+        for row_index, row in enumerate(table_data):
+            if isinstance(row, list):
+                for cell_index, cell in enumerate(row):
+                    if isinstance(cell, str):
+                        positions.append((table_index, row_index, cell_index))
+                        cells.append(cell)
+    return positions, cells
+
+def _apply_cells(tables: List[List], positions: List[Tuple[int, int, int]], results: List[Tuple[Any, Dict[str, List[str]]]], all_phi_info: Dict[str, List[str]]) -> List[List]:
+    """Copy the tables with deidentified cells written back and merge their PHI."""
+    processed_tables = [
+        [list(row) if isinstance(row, list) else row for row in table_data]
+        if isinstance(table_data, list) else table_data
+        for table_data in tables
+    ]
+
+    for (table_index, row_index, cell_index), (processed_cell, phi_info) in zip(positions, results):
+        processed_tables[table_index][row_index][cell_index] = processed_cell
+        # Merge PHI information
+        for key in all_phi_info:
+            all_phi_info[key].extend(phi_info.get(key, []))
+
+    return processed_tables
+
+def process_tables_data(tables: List[List], batch_size: Optional[int] = None, n_process: Optional[int] = None) -> Tuple[List[List], Dict[str, List[str]]]:
+    """Process several tables with one batched NER pass over all of their string cells."""
+    all_phi_info = _empty_phi_info()
+    positions, cells = _collect_cells(tables)
+    results = deidentify_texts(cells, batch_size, n_process)
+    return _apply_cells(tables, positions, results, all_phi_info), all_phi_info
+
+def process_table_data(table_data: List, batch_size: Optional[int] = None, n_process: Optional[int] = None) -> Tuple[List, Dict[str, List[str]]]:
     """Process table data and return both processed data and extracted PHI."""
     if not isinstance(table_data, list):
         return table_data, {}
-        
-    processed_data = []
-    all_phi_info = {
-        "names": [], "phones": [], "emails": [], "ssns": [],
-        "mrns": [], "dates": [], "addresses": []
-    }
 
-    for row in table_data:
-        if isinstance(row, list):
-            processed_row = []
-            for cell in row:
-                if isinstance(cell, str):
-                    processed_cell, phi_info = deidentify_text(cell)
-                    processed_row.append(processed_cell)
-                    # Merge PHI information
-                    for key in all_phi_info:
-                        all_phi_info[key].extend(phi_info.get(key, []))
-                else:
-                    processed_row.append(cell)
-            processed_data.append(processed_row)
-        else:
-            processed_data.append(row)
+    processed_tables, all_phi_info = process_tables_data([table_data], batch_size, n_process)
+    return processed_tables[0], all_phi_info
+
+def _prepare_document(data: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Copy an extraction result and return (copy, dicts owning a 'text', tables with 'data')."""
+    deidentified_data = data.copy()
+
+    if 'pages' in data:
+        # Copy pages and their tables so the input stays untouched
+        pages = []
+        for page in data['pages']:
+            page = dict(page)
+            if isinstance(page.get('tables'), list):
+                page['tables'] = [dict(table) for table in page['tables']]
+            pages.append(page)
+        deidentified_data['pages'] = pages
+        text_owners = [page for page in pages if 'text' in page]
+        tables = document_tables(pages)
+    else:
+        # Without pages the root text and tables are the only content
+        text_owners = [deidentified_data] if 'text' in data else []
+        tables = [dict(table) for table in data.get('tables', [])]
+        if 'tables' in data:
+            deidentified_data['tables'] = tables
+    tables = [table for table in tables if 'data' in table]
+    return deidentified_data, text_owners, tables
+
+def deidentify_documents(documents: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Dict[str, List[str]]]]:
+    """
+    Deidentify several extract_pdf_content results together.
+
+    The page texts and table cells of every document go through a single
+    deidentify_texts batch, so the NER overhead is paid once per batch rather
+    than once per document. Each text and cell is deidentified exactly once;
+    the document-level "text" and "tables" are rebuilt from the deidentified
+    pages instead of being processed a second time.
+
+    Args:
+        documents: Extraction results (the inputs are not modified)
+
+    Returns:
+        One (deidentified copy of the data, extracted PHI information) tuple
+        per document, in order
+    """
+    prepared = []
+    texts = []
+    for data in documents:
+        deidentified_data, text_owners, tables = _prepare_document(data)
+        positions, cells = _collect_cells([table['data'] for table in tables])
+        prepared.append((data, deidentified_data, text_owners, tables, positions, len(texts)))
+        texts.extend(owner['text'] for owner in text_owners)
+        texts.extend(cells)
+
+    results = deidentify_texts(texts)
+
+    output = []
+    for data, deidentified_data, text_owners, tables, positions, offset in prepared:
+        all_phi_info = _empty_phi_info()
+        text_results = results[offset:offset + len(text_owners)]
+        cell_results = results[offset + len(text_owners):offset + len(text_owners) + len(positions)]
+
+        for owner, (deidentified_text, phi_info) in zip(text_owners, text_results):
+            owner['text'] = deidentified_text
+            # Merge PHI information
+            for key in all_phi_info:
+                all_phi_info[key].extend(phi_info.get(key, []))
+
+        processed_tables = _apply_cells(
+            [table['data'] for table in tables], positions, cell_results, all_phi_info
+        )
+        for table, processed_data in zip(tables, processed_tables):
+            table['data'] = processed_data
+
+        if 'pages' in data:
+            # Root level text and tables are derived from the deidentified pages
+            pages = deidentified_data['pages']
+            if 'text' in data:
+                deidentified_data['text'] = document_text(pages)
+            if 'tables' in data:
+                deidentified_data['tables'] = document_tables(pages)
 
-    return processed_data, all_phi_info
+        # Remove duplicates from PHI information
+        for key in all_phi_info:
+            all_phi_info[key] = list(set(all_phi_info[key]))
+
+        output.append((deidentified_data, all_phi_info))
+    return output
+
+def deidentify_document(data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, List[str]]]:
+    """
+    Deidentify an extract_pdf_content result.
+
+    Args:
+        data: Extraction result (the input is not modified)
+
+    Returns:
+        Tuple of (deidentified copy of the data, extracted PHI information)
+    """
+    return deidentify_documents([data])[0]
+
+def document_search_text(data: Dict[str, Any]) -> str:
+    """Text and table cells of an extraction result, joined for a quick scan."""
+    parts = [data.get('text', '')]
+    for table in data.get('tables', []):
+        for row in table.get('data', []) or []:
+            parts.extend(str(cell) for cell in row or [] if cell)
+    return "\n".join(parts)
+
+def ownership_precheck(data: Dict[str, Any], fingerprint: Dict[str, Any]) -> Tuple[str, Dict[str, bool]]:
+    """
+    Cheap ownership check on an extraction result, run before any NER.
+
+    The user's normalized name, email, phone, DOB and SSN are searched for in
+    the normalized document text, and the regex patterns are used to tell
+    whether the document carries identifiers at all. The DOB is searched for
+    in several date orders; that only affects this precheck, since a "match"
+    still has to pass verify_ownership.
+
+    Returns:
+        Tuple of (outcome, fields found): "match" when one of the user's
+        identifiers appears, "reject" when none does but the document has
+        identifiers of its own, otherwise "inconclusive"
+    """
+    start = time.perf_counter()
+    text = document_search_text(data)
+    normalized_text = normalize(text)
+    found = {
+        "name_match": bool(fingerprint["name"]) and (
+            fingerprint["name"] in normalized_text
+            or any(token in normalized_text for token in fingerprint["name_tokens"])
+        ),
+        "email_match": bool(fingerprint["email"]) and fingerprint["email"] in text.lower(),
+        "phone_match": bool(fingerprint["phone"]) and fingerprint["phone"] in normalized_text,
+        "dob_match": any(dob in normalized_text for dob in fingerprint["dob_variants"]),
+        "ssn_match": bool(fingerprint["ssn"]) and fingerprint["ssn"] in normalized_text
+    }
+    if any(found.values()):
+        outcome = "match"
+    elif any(label in OWNERSHIP_IDENTIFIER_LABELS for _, _, label in regex_phi_spans(text)):
+        outcome = "reject"
+    else:
+        outcome = "inconclusive"
+    metrics.PHI_VERIFICATION_SECONDS.observe(time.perf_counter() - start, stage="precheck")
+    return outcome, found
+
+def verify_ownership(phi_info: Dict[str, List[str]], fingerprint: Dict[str, Any]) -> Dict[str, bool]:
+    """Compare the PHI found during de-identification with the user's fingerprint."""
+    start = time.perf_counter()
+    user_name = fingerprint["name"]
+    results = {
+        "name_match": any(normalize(name) in user_name or user_name in normalize(name) for name in phi_info.get("names", [])),
+        "email_match": any(email.lower() == fingerprint["email"] for email in phi_info.get("emails", [])),
+        "phone_match": any(normalize(phone) == fingerprint["phone"] for phone in phi_info.get("phones", [])),
+        "dob_match": any(normalize(dob) == fingerprint["dob"] for dob in phi_info.get("dates", [])),
+        "ssn_match": any(normalize(ssn) == fingerprint["ssn"] for ssn in phi_info.get("ssns", []))
+    }
+    metrics.PHI_VERIFICATION_SECONDS.observe(time.perf_counter() - start, stage="final")
+    return results
 
 def process_json_file(input_file: str, output_file: str) -> Tuple[bool, Dict[str, List[str]]]:
     """Process JSON file and return success status and extracted PHI information."""
@@ -137,44 +479,7 @@ def process_json_file(input_file: str, output_file: str) -> Tuple[bool, Dict[str
         with open(input_file, 'r', encoding='utf-8') as file:
             data = json.load(file)
 
-        # Create a copy of the data to modify
-        deidentified_data = data.copy()
-        all_phi_info = {
-            "names": [], "phones": [], "emails": [], "ssns": [],
-            "mrns": [], "dates": [], "addresses": []
-        }
-
-        # Process text fields
-        if 'text' in deidentified_data:
-            deidentified_data['text'], phi_info = deidentify_text(deidentified_data['text'])
-            # Merge PHI information
-            for key in all_phi_info:
-                all_phi_info[key].extend(phi_info.get(key, []))
-
-        # Process pages
-        if 'pages' in deidentified_data:
-            for page in deidentified_data['pages']:
-                if 'text' in page:
-                    page['text'], phi_info = deidentify_text(page['text'])
-                    # Merge PHI information
-                    for key in all_phi_info:
-                        all_phi_info[key].extend(phi_info.get(key, []))
-                if 'tables' in page:
-                    for table in page['tables']:
-                        if 'data' in table:
-                            table['data'], table_phi = process_table_data(table['data'])
-                            # Merge PHI information
-                            for key in all_phi_info:
-                                all_phi_info[key].extend(table_phi.get(key, []))
-    
-        # Process tables at root level
-        if 'tables' in deidentified_data:
-            for table in deidentified_data['tables']:
-                if 'data' in table:
-                    table['data'], table_phi = process_table_data(table['data'])
-                    # Merge PHI information
-                    for key in all_phi_info:
-                        all_phi_info[key].extend(table_phi.get(key, []))
+        deidentified_data, all_phi_info = deidentify_document(data)
 
         # Write the de-identified data to a new JSON file
         with open(output_file, 'w', encoding='utf-8') as file:
@@ -183,11 +488,7 @@ def process_json_file(input_file: str, output_file: str) -> Tuple[bool, Dict[str
         print("Successfully completed de-identification of JSON file!")
         conversion_time = time.time() - start
         print(f"Time taken for conversion : {conversion_time}")
-        
-        # Remove duplicates from PHI information
-        for key in all_phi_info:
-            all_phi_info[key] = list(set(all_phi_info[key]))
-            
+
         return True, all_phi_info
 
     except Exception as e:
@@ -1,23 +1,190 @@
+import os
 import time
-from typing import Dict, Any
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Tuple, Union
 import fitz
 from fastapi import HTTPException
+import metrics
 
+# Documents with at least this many pages are split into page ranges that are
+# extracted in parallel worker processes
+PARALLEL_PAGE_THRESHOLD = int(os.getenv("PARALLEL_PAGE_THRESHOLD", "8"))
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
 
-def extract_pdf_content(pdf_bytes: bytes) -> Dict[str, Any]:
+# Table detection mode: "always" runs page.find_tables on every page, "never"
+# skips it, and "auto" only runs it on pages whose layout looks like a table
+TABLE_EXTRACTION_MODES = ("always", "auto", "never")
+TABLE_EXTRACTION_MODE = os.getenv("TABLE_EXTRACTION_MODE", "auto").lower()
+
+# "auto" thresholds: axis-aligned ruling segments drawn on the page, or rows
+# of text blocks laid out side by side in aligned columns
+MIN_RULING_LINES = 3
+MIN_COLUMN_ROWS = 3
+
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+
+def document_text(pages: List[Dict[str, Any]]) -> str:
+    """Document-level text, derived from the per-page text."""
+    return "".join(page.get("text", "") + "\n" for page in pages)
+
+
+def document_tables(pages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Document-level table list, referencing the same table objects as the pages."""
+    return [table for page in pages for table in page.get("tables", [])]
+
+
+def _count_ruling_lines(page) -> int:
+    """Count horizontal/vertical line segments and rectangle edges in the page's vector drawings."""
+    count = 0
+    for drawing in page.get_drawings():
+        for item in drawing["items"]:
+            if item[0] == "l":
+                start, end = item[1], item[2]
+                if abs(start.x - end.x) < 1 or abs(start.y - end.y) < 1:
+                    count += 1
+            elif item[0] in ("re", "qu"):
+                count += 4
+            if count >= MIN_RULING_LINES:
+                return count
+    return count
+
+
+def _count_column_rows(page) -> int:
+    """Count rows of text where several blocks sit side by side at the same height."""
+    rows = {}
+    for x0, y0, x1, y1, text, block_no, block_type in page.get_text("blocks"):
+        if block_type == 0 and text.strip():
+            rows.setdefault(round((y0 + y1) / 2), []).append(x0)
+    return sum(1 for starts in rows.values() if len(starts) > 1)
+
+
+def page_may_have_tables(page) -> bool:
+    """Cheap pre-check run before the much more expensive page.find_tables."""
+    return _count_ruling_lines(page) >= MIN_RULING_LINES or _count_column_rows(page) >= MIN_COLUMN_ROWS
+
+
+def _extract_page(page, page_num: int, table_mode: str = "always") -> Dict[str, Any]:
+    """Extract the text and tables of a single page."""
+    # Extract text from page
+    page_text = page.get_text()
+
+    # Store page-specific information
+    page_info = {
+        "page_number": page_num + 1,
+        "text": page_text,
+        "char_count": len(page_text),
+        "word_count": len(page_text.split()) if page_text else 0
+    }
+
+    if table_mode == "never" or (table_mode == "auto" and not page_may_have_tables(page)):
+        return page_info
+
+    # Try to extract tables from page
+    table_start = time.perf_counter()
+    try:
+        page_tables = page.find_tables()
+        if page_tables:
+            page_tables_data = []
+            for table_num, table in enumerate(page_tables):
+                table_data = table.extract()
+                page_tables_data.append({
+                    "table_number": table_num + 1,
+                    "data": table_data,
+                    "rows": len(table_data),
+                    "columns": len(table_data[0]) if table_data else 0
+                })
+            page_info["tables"] = page_tables_data
+    except Exception as e:
+        # If table extraction fails, continue without tables
+        page_info["tables"] = []
+    metrics.TABLE_DETECTION_SECONDS.observe(time.perf_counter() - table_start)
+
+    return page_info
+
+
+def _open_pdf(pdf_source: Union[bytes, str]):
+    """Open a PDF given as bytes or as a file path, without copying it first."""
+    if isinstance(pdf_source, (bytes, bytearray)):
+        return fitz.open(stream=pdf_source, filetype="pdf")
+    return fitz.open(pdf_source, filetype="pdf")
+
+
+def _extract_page_range(pdf_source: Union[bytes, str], first_page: int, last_page: int, table_mode: str) -> List[Dict[str, Any]]:
+    """Open the PDF independently and extract pages [first_page, last_page)."""
+    doc = _open_pdf(pdf_source)
+    try:
+        return [_extract_page(doc[page_num], page_num, table_mode) for page_num in range(first_page, last_page)]
+    finally:
+        doc.close()
+
+
+def _extract_page_range_journaled(*args) -> Tuple[List[Dict[str, Any]], List]:
+    """_extract_page_range for the page pool, returning its metrics journal too."""
+    return metrics.run_journaled(_extract_page_range, *args)
+
+
+def _get_page_pool():
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            _page_pool = ProcessPoolExecutor(
+                max_workers=EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _page_pool
+
+
+def shutdown_page_pool():
+    global _page_pool
+    with _page_pool_lock:
+        pool, _page_pool = _page_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_pages_parallel(pdf_source: Union[bytes, str], page_count: int, table_mode: str) -> List[Dict[str, Any]]:
+    """Split the pages into contiguous ranges, extract them in worker processes and reassemble in order."""
+    range_size = -(-page_count // EXTRACT_WORKERS)
+    futures = [
+        _get_page_pool().submit(
+            _extract_page_range_journaled, pdf_source, first_page, min(first_page + range_size, page_count), table_mode
+        )
+        for first_page in range(0, page_count, range_size)
+    ]
+    pages = []
+    for future in futures:
+        range_pages, journal = future.result()
+        metrics.replay(journal)
+        pages.extend(range_pages)
+    return pages
+
+
+def extract_pdf_content(pdf_source: Union[bytes, str], parallel: bool = True, table_mode: str = None) -> Dict[str, Any]:
     """
     Extract all content from PDF using PyMuPDF
     
     Args:
-        pdf_bytes: PDF file as bytes
+        pdf_source: PDF file as bytes, or the path of a PDF file
+        parallel: Allow splitting documents of PARALLEL_PAGE_THRESHOLD pages
+            or more across worker processes
+        table_mode: "always", "auto" or "never" (defaults to TABLE_EXTRACTION_MODE)
         
     Returns:
         Dictionary containing extracted content
     """
+    table_mode = (table_mode or TABLE_EXTRACTION_MODE).lower()
+    if table_mode not in TABLE_EXTRACTION_MODES:
+        raise ValueError(f"Unknown table extraction mode: {table_mode}")
+
     try:
-        # Open PDF from bytes
+        # Open PDF from bytes or file
         start = time.time()
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        doc = _open_pdf(pdf_source)
         
         # Initialize result dictionary
         result = {
@@ -32,43 +199,27 @@ def extract_pdf_content(pdf_bytes: bytes) -> Dict[str, Any]:
         result["metadata"] = doc.metadata
         
         # Extract content from each page
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            
-            # Extract text from page
-            page_text = page.get_text()
-            result["text"] += page_text + "\n"
-            
-            # Store page-specific information
-            page_info = {
-                "page_number": page_num + 1,
-                "text": page_text,
-                "char_count": len(page_text),
-                "word_count": len(page_text.split()) if page_text else 0
-            }
-            
-            # Try to extract tables from page
+        pages = None
+        if parallel and EXTRACT_WORKERS > 1 and len(doc) >= PARALLEL_PAGE_THRESHOLD:
             try:
-                page_tables = page.find_tables()
-                if page_tables:
-                    page_tables_data = []
-                    for table_num, table in enumerate(page_tables):
-                        table_data = table.extract()
-                        page_tables_data.append({
-                            "table_number": table_num + 1,
-                            "data": table_data,
-                            "rows": len(table_data),
-                            "columns": len(table_data[0]) if table_data else 0
-                        })
-                    page_info["tables"] = page_tables_data
-                    result["tables"].extend(page_tables_data)
+                pages = _extract_pages_parallel(pdf_source, len(doc), table_mode)
             except Exception as e:
-                # If table extraction fails, continue without tables
-                page_info["tables"] = []
-            
-            result["pages"].append(page_info)
+                # Fall back to extracting in this process (e.g. when worker
+                # processes cannot be started here)
+                if isinstance(e, BrokenProcessPool):
+                    shutdown_page_pool()
+                print(f"Parallel page extraction failed, extracting serially: {str(e)}")
+        if pages is None:
+            pages = [_extract_page(doc[page_num], page_num, table_mode) for page_num in range(len(doc))]
+        result["pages"] = pages
         
+        # Document-level text and tables are derived from the pages rather
+        # than accumulated separately
+        result["text"] = document_text(result["pages"])
+        result["tables"] = document_tables(result["pages"])
+
         processing_duration = time.time() - start
+        metrics.EXTRACTION_SECONDS.observe(processing_duration)
         # Clean up
         doc.close()
         
@@ -83,4 +234,4 @@ def extract_pdf_content(pdf_bytes: bytes) -> Dict[str, Any]:
         return result, processing_duration
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
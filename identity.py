@@ -0,0 +1,48 @@
+import re
+from datetime import datetime
+from typing import Any, Dict, List
+
+# Date formats the stored DOB may be written in
+DOB_INPUT_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%m-%d-%Y", "%d-%m-%Y")
+
+# Name parts shorter than this (initials, "Jr") are too common to search for
+MIN_NAME_TOKEN_LENGTH = 3
+
+
+def normalize(s):
+    """Custom normalisation function"""
+    return re.sub(r'[^a-zA-Z0-9]', '', s or '').lower()
+
+
+def _dob_variants(dob: str) -> List[str]:
+    """Normalized spellings of the DOB: as stored, YYYYMMDD, MMDDYYYY and DDMMYYYY"""
+    variants = {normalize(dob)}
+    for fmt in DOB_INPUT_FORMATS:
+        try:
+            parsed = datetime.strptime(dob.strip(), fmt)
+        except ValueError:
+            continue
+        variants.update(parsed.strftime(out) for out in ("%Y%m%d", "%m%d%Y", "%d%m%Y"))
+    variants.discard("")
+    return sorted(variants)
+
+
+def build_fingerprint(user_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Normalized identifiers of a user, computed once and reused for every
+    ownership check of their uploads.
+    """
+    name = user_data.get("name", "") or ""
+    return {
+        "name": normalize(name),
+        "name_tokens": sorted({
+            normalize(token) for token in name.split()
+            if len(normalize(token)) >= MIN_NAME_TOKEN_LENGTH
+        }),
+        "email": (user_data.get("email", "") or "").lower(),
+        "phone": normalize(user_data.get("phone", "")),
+        "dob": normalize(user_data.get("dob", "")),
+        # Only for the precheck, which never accepts a document by itself
+        "dob_variants": _dob_variants(user_data.get("dob", "") or ""),
+        "ssn": normalize(user_data.get("ssn", ""))
+    }
@@ -0,0 +1,313 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Union
+from paths import DATA_DIR
+from workers import run_io
+
+JOBS_DIR = DATA_DIR / "jobs"
+JOBS_DB_FILE = JOBS_DIR / "jobs.sqlite3"
+
+# Pipelines run at once by this process's job workers
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+# Idle workers and event tails look for new work/events this often, which
+# also picks up changes made by other server processes
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+
+# Running jobs refresh their heartbeat this often; a job whose heartbeat is
+# older than JOB_STALE_SECONDS (its process died) is queued again
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "60"))
+
+# A job that was started this many times without finishing (e.g. because it
+# keeps crashing the server) is failed instead of queued again
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+JOB_FINISHED_STATUSES = ("done", "failed")
+
+
+class JobStore:
+    """SQLite record of jobs and the NDJSON progress events each one emitted"""
+
+    def __init__(self, db_file: Path = JOBS_DB_FILE):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self.local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, username TEXT, status TEXT, pdf_path TEXT, pdf_hash TEXT, "
+            "attempts INTEGER DEFAULT 0, created_at REAL, updated_at REAL, heartbeat_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            "job_id TEXT, seq INTEGER, event TEXT, PRIMARY KEY (job_id, seq))"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_file), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=10000")
+            conn.row_factory = sqlite3.Row
+            self.local.conn = conn
+        return conn
+
+    def create(self, job_id: str, username: str, pdf_path: str, pdf_hash: str):
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO jobs (id, username, status, pdf_path, pdf_hash, created_at, updated_at) "
+            "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+            (job_id, username, pdf_path, pdf_hash, now, now)
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Atomically move the oldest queued job to running, across processes"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                    "updated_at = ?, heartbeat_at = ? WHERE id = ?",
+                    (now, now, row["id"])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        job = dict(row)
+        job["status"] = "running"
+        job["attempts"] += 1
+        return job
+
+    def heartbeat(self, job_id: str):
+        self._conn().execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def finish(self, job_id: str, status: str):
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (status, time.time(), job_id)
+        )
+
+    def requeue(self, job_id: str):
+        self._conn().execute(
+            "UPDATE jobs SET status = 'queued', updated_at = ? WHERE id = ? AND status = 'running'",
+            (time.time(), job_id)
+        )
+
+    def requeue_stale(self, stale_seconds: float = JOB_STALE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS) -> int:
+        """
+        Queue running jobs again whose process stopped sending heartbeats;
+        those already started max_attempts times are failed instead.
+        """
+        now = time.time()
+        conn = self._conn()
+        exhausted = conn.execute(
+            "SELECT id, attempts, pdf_path FROM jobs WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+            (now - stale_seconds, max_attempts)
+        ).fetchall()
+        for row in exhausted:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'failed', updated_at = ? WHERE id = ? AND status = 'running'",
+                (now, row["id"])
+            )
+            if cursor.rowcount:
+                self.append_event(row["id"], {"progress": f"Job failed after {row['attempts']} attempts", "error": True})
+                try:
+                    os.unlink(row["pdf_path"])
+                except FileNotFoundError:
+                    pass
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'queued', updated_at = ? "
+            "WHERE status = 'running' AND heartbeat_at < ?",
+            (now, now - stale_seconds)
+        )
+        return cursor.rowcount
+
+    def append_event(self, job_id: str, event: Dict[str, Any]) -> int:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seq = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO job_events (job_id, seq, event) VALUES (?, ?, ?)",
+                (job_id, seq, json.dumps(event, ensure_ascii=False))
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return seq
+
+    def events(self, job_id: str, after: int = 0) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, after)
+        ).fetchall()
+        return [dict(json.loads(row["event"]), seq=row["seq"]) for row in rows]
+
+
+class JobQueue:
+    """
+    Runs uploaded PDFs through the pipeline in the background.
+
+    The pipeline is injected by start() (main passes process_pdf) so this
+    module does not import main. Each progress line the pipeline yields is
+    stored as a numbered event, so a client can disconnect and resume the
+    stream from the last seq it saw.
+    """
+
+    def __init__(self, store: Optional[JobStore] = None, workers: int = JOB_WORKERS, jobs_dir: Path = JOBS_DIR):
+        self.store = store or JobStore()
+        self.workers = workers
+        self.jobs_dir = Path(jobs_dir)
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.runner = None
+        self._tasks = []
+        self._running = set()
+        self._wakeup = None
+
+    async def start(self, runner: Callable[[Union[bytes, str], Dict[str, Any], str], AsyncIterator[str]]):
+        """Start the worker tasks; runner(pdf_source, current_user, pdf_hash) yields NDJSON lines"""
+        self.runner = runner
+        self._wakeup = asyncio.Event()
+        # Jobs left running by a previous process are picked up again
+        requeued = await run_io(self.store.requeue_stale)
+        if requeued:
+            print(f"Requeued {requeued} interrupted job(s)")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the workers; their unfinished jobs are queued for the next start"""
+        interrupted = set(self._running)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job_id in interrupted:
+            self.store.requeue(job_id)
+
+    def _write_pdf(self, job_id: str, pdf_source: Union[bytes, str]) -> str:
+        path = self.jobs_dir / f"{job_id}.pdf"
+        if isinstance(pdf_source, (bytes, bytearray)):
+            with open(path, 'wb') as f:
+                f.write(pdf_source)
+        else:
+            # Spooled uploads live under data/ too, so this is a rename
+            os.replace(pdf_source, path)
+        return str(path)
+
+    async def submit(self, username: str, pdf_source: Union[bytes, str], pdf_hash: str) -> str:
+        """Store the PDF with the job and queue it; returns the job id"""
+        job_id = uuid.uuid4().hex
+        pdf_path = await run_io(self._write_pdf, job_id, pdf_source)
+        await run_io(self.store.create, job_id, username, pdf_path, pdf_hash)
+        await run_io(self.store.append_event, job_id, {"progress": "Job queued"})
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def _worker(self):
+        while True:
+            try:
+                await run_io(self.store.requeue_stale)
+                job = await run_io(self.store.claim_next)
+            except Exception as e:
+                print(f"Job queue error: {str(e)}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep the worker alive; a job left running is requeued once stale
+                print(f"Job {job['id']} error: {str(e)}")
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                await run_io(self.store.heartbeat, job_id)
+            except Exception as e:
+                print(f"Failed to record job heartbeat: {str(e)}")
+
+    async def _run_job(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        self._running.add(job_id)
+        status = "failed"
+        try:
+            try:
+                if job["attempts"] > 1:
+                    await run_io(self.store.append_event, job_id, {"progress": "Job restarted"})
+                else:
+                    await run_io(self.store.append_event, job_id, {"progress": "Job started"})
+                async for line in self.runner(job["pdf_path"], {"username": job["username"]}, job["pdf_hash"]):
+                    event = json.loads(line)
+                    await run_io(self.store.append_event, job_id, event)
+                    if event.get("done"):
+                        status = "done"
+            except asyncio.CancelledError:
+                # Server shutting down: stop() queues the job again
+                raise
+            except Exception as e:
+                try:
+                    await run_io(self.store.append_event, job_id, {"progress": f"Processing failed: {str(e)}", "error": True})
+                except Exception as event_error:
+                    print(f"Failed to record job failure: {str(event_error)}")
+            await run_io(self.store.finish, job_id, status)
+        finally:
+            # Without heartbeats a job that could not be finished goes stale
+            # and is requeued (or failed after JOB_MAX_ATTEMPTS)
+            heartbeat.cancel()
+            self._running.discard(job_id)
+        try:
+            os.unlink(job["pdf_path"])
+        except FileNotFoundError:
+            pass
+
+    async def events(self, job_id: str, after: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """Replay the job's events after seq `after`, then follow new ones until it finishes"""
+        while True:
+            job = await run_io(self.store.get, job_id)
+            events = await run_io(self.store.events, job_id, after)
+            for event in events:
+                after = event["seq"]
+                yield event
+            # Status was read before the events, so nothing is missed when
+            # the job finishes in between
+            if job is None or job["status"] in JOB_FINISHED_STATUSES:
+                return
+            if not events:
+                await asyncio.sleep(JOB_POLL_SECONDS)
+
+
+job_queue = JobQueue()
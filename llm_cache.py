@@ -0,0 +1,234 @@
+import asyncio
+import contextvars
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.runnables import Runnable
+import metrics
+from paths import DATA_DIR
+
+LLM_CACHE_PATH = DATA_DIR / "cache" / "llm_cache.sqlite3"
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Responses made inside deferred_writes() are held back until they are known
+# to be good, and calls inside uncached() skip the cache altogether. Context
+# variables follow the calls into the tasks and threads asyncio creates.
+_pending_writes = contextvars.ContextVar("llm_cache_pending_writes", default=None)
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+class LLMResponseCache:
+    """
+    SQLite-backed store of LLM responses.
+
+    Keys combine the model name, temperature and a hash of the rendered
+    prompt. Entries older than ttl_seconds are dropped on read, and the least
+    recently used entries are evicted once there are more than max_entries.
+    """
+
+    def __init__(self, path: Path = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES, ttl_seconds: int = LLM_CACHE_TTL_SECONDS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, created_at REAL, last_used REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model: str, temperature: Any, prompt: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{model}\0{temperature}\0{prompt_hash}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                metrics.CACHE_REQUESTS.inc(cache="llm", result="miss")
+                return None
+            self.conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            metrics.CACHE_REQUESTS.inc(cache="llm", result="hit")
+            return row[0]
+
+    def put(self, key: str, model: str, response: str):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+            self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now: float):
+        self.conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        excess = self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+class CachedMessage(AIMessage):
+    """Response answered from the LLMResponseCache"""
+
+
+class CachedMessageChunk(AIMessageChunk):
+    """Cached response sent by CachedChatModel.astream"""
+
+
+def is_cached(message) -> bool:
+    """Whether a response or stream chunk came from the cache rather than the model"""
+    return isinstance(message, (CachedMessage, CachedMessageChunk))
+
+
+class DeferredWrites:
+    """Cache writes held back by deferred_writes(), written by commit()"""
+
+    def __init__(self):
+        self.writes: List[tuple] = []
+
+    async def commit(self):
+        for cache, key, model, response in self.writes:
+            await asyncio.to_thread(cache.put, key, model, response)
+        self.writes = []
+
+
+@contextmanager
+def deferred_writes():
+    """
+    Hold back the cache writes of LLM calls made in the block.
+
+    Used for generation attempts that may fail validation: their responses
+    are only cached once commit() is awaited, so a failed attempt is sampled
+    again next time instead of being replayed from the cache.
+    """
+    pending = DeferredWrites()
+    token = _pending_writes.set(pending)
+    try:
+        yield pending
+    finally:
+        _pending_writes.reset(token)
+
+
+@contextmanager
+def uncached():
+    """Neither read nor write the cache for LLM calls made in the block"""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+class CachedChatModel(Runnable):
+    """
+    Wraps a LangChain chat model so identical prompts are answered from the
+    LLMResponseCache. Use it anywhere the model was used, e.g. prompt | model.
+    """
+
+    def __init__(self, model, cache: LLMResponseCache):
+        self.model = model
+        self.cache = cache
+        self.model_name = getattr(model, "model", None) or getattr(model, "model_name", type(model).__name__)
+        self.temperature = getattr(model, "temperature", None)
+
+    def _key(self, input) -> str:
+        prompt = input.to_string() if hasattr(input, "to_string") else str(input)
+        return self.cache.make_key(self.model_name, self.temperature, prompt)
+
+    def _defer(self, key: str, response: str) -> bool:
+        """Queue the write if inside deferred_writes(); False if it should happen now"""
+        pending = _pending_writes.get()
+        if pending is None:
+            return False
+        pending.writes.append((self.cache, key, self.model_name, response))
+        return True
+
+    def invoke(self, input, config=None, **kwargs):
+        if _bypass.get():
+            return self.model.invoke(input, config, **kwargs)
+        key = self._key(input)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return CachedMessage(content=cached)
+        result = self.model.invoke(input, config, **kwargs)
+        if result.content and not self._defer(key, result.content):
+            self.cache.put(key, self.model_name, result.content)
+        return result
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        if _bypass.get():
+            return await self.model.ainvoke(input, config, **kwargs)
+        key = self._key(input)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            return CachedMessage(content=cached)
+        result = await self.model.ainvoke(input, config, **kwargs)
+        if result.content and not self._defer(key, result.content):
+            await asyncio.to_thread(self.cache.put, key, self.model_name, result.content)
+        return result
+
+    async def astream(self, input, config=None, **kwargs):
+        """Stream the model's chunks; a cached response arrives as one chunk"""
+        if _bypass.get():
+            async for chunk in self.model.astream(input, config, **kwargs):
+                yield chunk
+            return
+        key = self._key(input)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            yield CachedMessageChunk(content=cached)
+            return
+        parts = []
+        async for chunk in self.model.astream(input, config, **kwargs):
+            if isinstance(chunk.content, str):
+                parts.append(chunk.content)
+            yield chunk
+        # Only a completed stream is cached
+        content = "".join(parts)
+        if content and not self._defer(key, content):
+            await asyncio.to_thread(self.cache.put, key, self.model_name, content)
+
+
+llm_cache = LLMResponseCache() if LLM_CACHE_ENABLED else None
+
+
+def with_cache(model):
+    """Return the model wrapped in the shared response cache, if caching is enabled"""
+    if llm_cache is None:
+        return model
+    return CachedChatModel(model, llm_cache)
@@ -1,99 +1,265 @@
+import asyncio
 import json
 import os
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import ChatPromptTemplate
 import traceback
 from prompt_templates import structure_prompt_template, summary_prompt_template
-from validation import validation_check
+from validation import avalidate_summary, ainvoke_with_timeout, astream_with_timeout
+from llm_router import get_llm
+from llm_cache import deferred_writes
+import metrics
 
 # Load environment variables
 load_dotenv()
 
-# Get API keys with better error handling
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-GROQ_API_KEY = os.getenv('GROQ_API_KEY')
+# Long reports are summarized map-reduce style: "single" always sends the whole
+# text in one prompt, "chunked" always splits it, "auto" splits only when the
+# text is over CHUNK_TOKEN_BUDGET
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "auto").lower()
+CHUNK_TOKEN_BUDGET = int(os.getenv("CHUNK_TOKEN_BUDGET", "6000"))
+CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", "4"))
 
-# Validate API keys
-if not GEMINI_API_KEY:
-    raise ValueError(
-        "GEMINI_API_KEY environment variable is not set. "
-        "Please create a .env file in the backend directory with your API key: "
-        "GEMINI_API_KEY=your_api_key_here"
-    )
+# Rough token estimate, good enough for budgeting prompts
+CHARS_PER_TOKEN = 4
 
-if not GROQ_API_KEY:
-    raise ValueError(
-        "GROQ_API_KEY environment variable is not set. "
-        "Please create a .env file in the backend directory with your API key: "
-        "GROQ_API_KEY=your_api_key_here"
-    )
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
 
-# Initialize language models
-try:
-    llama = ChatGroq(
-        api_key=GROQ_API_KEY,
-        model='llama-3.3-70b-versatile',
-        temperature=0.7
-    )
+def _split_section(text: str, token_budget: int) -> list:
+    """Split an oversized page into pieces under the budget, on line boundaries."""
+    pieces = []
+    current = []
+    current_tokens = 0
+    for line in text.splitlines(keepends=True):
+        line_tokens = estimate_tokens(line)
+        if current and current_tokens + line_tokens > token_budget:
+            pieces.append("".join(current))
+            current = []
+            current_tokens = 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        pieces.append("".join(current))
+    return pieces
 
-    gemini = ChatGoogleGenerativeAI(
-        google_api_key=GEMINI_API_KEY,
-        model='gemini-2.0-flash',
-        temperature=0.7
-    )
-except Exception as e:
-    raise ValueError(f"Failed to initialize language models: {str(e)}")
+def split_into_chunks(data, token_budget: int = CHUNK_TOKEN_BUDGET) -> list:
+    """
+    Split a de-identified document into chunks of at most token_budget tokens.
 
-def get_summary(filepath):
-    try:
-        with open(filepath, 'r') as file:
-            data = json.load(file)
-            
-        RAW_DATA = data['text']
-        RAW_DATA.replace("\n", " ")
+    Consecutive pages are grouped together while they fit; a page that is too
+    large on its own is split on line boundaries.
+    """
+    pages = [page.get("text", "") for page in data.get("pages", [])] or [data["text"]]
 
-        critique_feedback = None  # Initialize critique_feedback for the first iteration
+    sections = []
+    for page_text in pages:
+        if estimate_tokens(page_text) <= token_budget:
+            sections.append(page_text)
+        else:
+            sections.extend(_split_section(page_text, token_budget))
 
-        for i in range(3): # Loop up to 3 times
-            print(f"Attempt {i+1} to generate summary...")
-            # Create the prompt template, passing critique_feedback if available
-            # Assuming structure_prompt_template accepts CRITIQUE_FEEDBACK as a keyword argument
-            raw2str_prompt = ChatPromptTemplate.from_template(structure_prompt_template(RAW_DATA, CRITIQUE_FEEDBACK=critique_feedback))
-            # Create the chain
-            raw2str_chain = raw2str_prompt | gemini
+    chunks = []
+    current = []
+    current_tokens = 0
+    for section in sections:
+        if not section.strip():
+            continue
+        section_tokens = estimate_tokens(section)
+        if current and current_tokens + section_tokens > token_budget:
+            chunks.append("\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(section)
+        current_tokens += section_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+async def _generate_summary(chain, inputs: dict, attempt: int, on_event=None) -> str:
+    """
+    Run the summary chain. With on_event, the summary is streamed and every
+    partial chunk is passed on as a {"summary_delta", "attempt"} event.
+    """
+    if on_event is None:
+        return (await ainvoke_with_timeout(chain, inputs, "Summary")).content
+    parts = []
+    async for text in astream_with_timeout(chain, inputs, "Summary"):
+        parts.append(text)
+        await on_event({"progress": "Summary chunk", "summary_delta": text, "attempt": attempt})
+    return "".join(parts)
+
+async def _retract_summary(attempt: int, on_event=None):
+    """Tell a streaming client to discard the chunks of an attempt that failed validation"""
+    if on_event is not None:
+        await on_event({"progress": "Summary failed validation", "summary_retracted": True, "attempt": attempt})
+
+async def _structure_and_summarize(RAW_DATA, on_event=None):
+    """Structure and summarize the whole text in one prompt, retrying with critique feedback."""
+    critique_feedback = None  # Initialize critique_feedback for the first iteration
+
+    for i in range(3): # Loop up to 3 times
+        print(f"Attempt {i+1} to generate summary...")
+        # Create the prompt template, passing critique_feedback if available
+        # Assuming structure_prompt_template accepts CRITIQUE_FEEDBACK as a keyword argument
+        raw2str_prompt = ChatPromptTemplate.from_template(structure_prompt_template(RAW_DATA, CRITIQUE_FEEDBACK=critique_feedback))
+        # Create the chain
+        raw2str_chain = raw2str_prompt | get_llm()
+        # The attempt's responses are only cached if its summary validates
+        with deferred_writes() as cache_writes:
             # Invoke the chain with the input variable
-            STRUCTURED_DATA = raw2str_chain.invoke({"raw_data": RAW_DATA, "CRITIQUE_FEEDBACK" : critique_feedback})
+            STRUCTURED_DATA = await ainvoke_with_timeout(raw2str_chain, {"raw_data": RAW_DATA, "CRITIQUE_FEEDBACK" : critique_feedback}, "Structuring")
 
             # Create the summary prompt template
             str2sum_prompt = ChatPromptTemplate.from_template(summary_prompt_template(STRUCTURED_DATA.content))
             # Create the chain
-            str2sum_chain = str2sum_prompt | gemini
+            str2sum_chain = str2sum_prompt | get_llm()
             # Invoke the chain with the input variable
-            summary = str2sum_chain.invoke({"structured_data": STRUCTURED_DATA}).content
-            
-            # Validate the generated summary
-            validation_result = validation_check(RAW_DATA, summary)
-            print(f"Validation result for attempt {i+1}: {validation_result}")
+            summary = await _generate_summary(str2sum_chain, {"structured_data": STRUCTURED_DATA}, i + 1, on_event)
+
+
+        # Validate the generated summary
+        validation_result = await avalidate_summary(RAW_DATA, summary, STRUCTURED_DATA.content)
+        print(f"Validation result for attempt {i+1}: {validation_result}")
+        if validation_result is None:
+            raise ValueError("Summary validation call failed")
+
+        metrics.SUMMARY_ATTEMPTS.inc(stage="single", outcome="passed" if "yes" in validation_result.lower() else "failed")
+        if "yes" in validation_result.lower():
+            # If validation passes, return the summary
+            print("Summary validated successfully!")
+            await cache_writes.commit()
+            return summary, True
+        else:
+            # If validation fails, update critique_feedback for the next iteration
+            print("Summary validation failed. Retrying with critique feedback.")
+            await _retract_summary(i + 1, on_event)
+            critique_feedback = validation_result
+            # Continue to the next iteration of the loop
 
+    # If the loop finishes without returning a valid summary after 3 attempts
+    print("Failed to generate a valid summary after multiple attempts.")
+    return "Failed to generate a valid summary after multiple attempts.", False
+
+async def _structure_chunk(chunk: str, index: int, semaphore: asyncio.Semaphore):
+    """
+    Structure one chunk, validating the structured output against the chunk's
+    own source text.
+
+    Returns:
+        Tuple of (structured data, whether it passed validation)
+    """
+    async with semaphore:
+        critique_feedback = None
+        for i in range(3):
+            raw2str_prompt = ChatPromptTemplate.from_template(structure_prompt_template(chunk, CRITIQUE_FEEDBACK=critique_feedback))
+            raw2str_chain = raw2str_prompt | get_llm()
+            with deferred_writes() as cache_writes:
+                structured = (await ainvoke_with_timeout(raw2str_chain, {"raw_data": chunk}, f"Structuring chunk {index + 1}")).content
+
+            validation_result = await avalidate_summary(chunk, structured)
+            print(f"Validation result for chunk {index + 1}, attempt {i+1}: {validation_result}")
+            if validation_result is None:
+                raise ValueError(f"Validation call failed for chunk {index + 1}")
+            metrics.SUMMARY_ATTEMPTS.inc(stage="chunk", outcome="passed" if "yes" in validation_result.lower() else "failed")
             if "yes" in validation_result.lower():
-                # If validation passes, return the summary
-                print("Summary validated successfully!")
-                return summary
-            else:
-                # If validation fails, update critique_feedback for the next iteration
-                print("Summary validation failed. Retrying with critique feedback.")
-                critique_feedback = validation_result
-                # Continue to the next iteration of the loop
-
-        # If the loop finishes without returning a valid summary after 3 attempts
-        print("Failed to generate a valid summary after multiple attempts.")
-        return "Failed to generate a valid summary after multiple attempts."
+                await cache_writes.commit()
+                return structured, True
+            critique_feedback = validation_result
+
+        return structured, False
+
+async def _map_reduce_summarize(chunks: list, on_event=None):
+    """
+    Structure the chunks concurrently (at most CHUNK_CONCURRENCY at a time),
+    merge the partial structured outputs and summarize the merged data.
+    """
+    semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+    structured_chunks = await asyncio.gather(
+        *(_structure_chunk(chunk, index, semaphore) for index, chunk in enumerate(chunks))
+    )
+    if not all(validated for _, validated in structured_chunks):
+        print("Failed to validate the structured data of every chunk.")
+        return "Failed to generate a valid summary after multiple attempts.", False
+
+    merged = "\n\n".join(
+        f"Section {index + 1}:\n{structured}" for index, (structured, _) in enumerate(structured_chunks)
+    )
+
+    # The final summary is validated against the merged structured data, which
+    # the chunk validations already tied back to the source text
+    critique_feedback = None
+    for i in range(3):
+        print(f"Attempt {i+1} to generate summary from {len(chunks)} chunks...")
+        str2sum_prompt = ChatPromptTemplate.from_template(summary_prompt_template(merged, CRITIQUE_FEEDBACK=critique_feedback))
+        str2sum_chain = str2sum_prompt | get_llm()
+        with deferred_writes() as cache_writes:
+            summary = await _generate_summary(str2sum_chain, {"structured_data": merged}, i + 1, on_event)
+
+        validation_result = await avalidate_summary(merged, summary)
+        print(f"Validation result for attempt {i+1}: {validation_result}")
+        if validation_result is None:
+            raise ValueError("Summary validation call failed")
+        metrics.SUMMARY_ATTEMPTS.inc(stage="reduce", outcome="passed" if "yes" in validation_result.lower() else "failed")
+        if "yes" in validation_result.lower():
+            print("Summary validated successfully!")
+            await cache_writes.commit()
+            return summary, True
+        await _retract_summary(i + 1, on_event)
+        critique_feedback = validation_result
+
+    print("Failed to generate a valid summary after multiple attempts.")
+    return "Failed to generate a valid summary after multiple attempts.", False
+
+async def asummarize(data, on_event=None):
+    """
+    Generate a validated summary of a de-identified document.
+
+    Every LLM call is awaited with ainvoke under LLM_CALL_TIMEOUT_SECONDS, so
+    cancelling the calling task (e.g. when the client disconnects from the
+    upload stream) cancels the in-flight request. Documents over
+    CHUNK_TOKEN_BUDGET are summarized map-reduce style (see SUMMARY_MODE).
+
+    With on_event, the final summary call is streamed: each partial chunk is
+    awaited as on_event({"progress", "summary_delta", "attempt"}), and an
+    attempt that then fails validation is followed by
+    on_event({"progress", "summary_retracted": True, "attempt"}). The returned
+    summary is always the one that counts.
+
+    Args:
+        data: De-identified extraction result, or the path of a JSON file holding one
+        on_event: Optional async callable receiving streaming events
+
+    Returns:
+        Tuple of (summary or failure message, whether the summary passed validation)
+    """
+    try:
+        if isinstance(data, (str, os.PathLike)):
+            with open(data, 'r') as file:
+                data = json.load(file)
+
+        RAW_DATA = data['text']
+        RAW_DATA.replace("\n", " ")
+
+        if SUMMARY_MODE == "chunked" or (SUMMARY_MODE == "auto" and estimate_tokens(RAW_DATA) > CHUNK_TOKEN_BUDGET):
+            chunks = split_into_chunks(data)
+            if len(chunks) > 1:
+                return await _map_reduce_summarize(chunks, on_event)
+
+        return await _structure_and_summarize(RAW_DATA, on_event)
         
     except Exception as e:
         error_details = traceback.format_exc()
-        return f"Error: {str(e)}\nDetailed traceback:\n{error_details}"
+        return f"Error: {str(e)}\nDetailed traceback:\n{error_details}", False
+
+def summarize(data):
+    """Blocking wrapper around asummarize for scripts outside the event loop."""
+    return asyncio.run(asummarize(data))
+
+def get_summary(data):
+    """Generate a validated summary of a de-identified document (see summarize)."""
+    summary, _ = summarize(data)
+    return summary
     
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+import os
+import threading
+from dotenv import load_dotenv
+from llm_cache import with_cache
+
+# Load environment variables
+load_dotenv()
+
+# Clients are created on first use, so importing the app does not need the
+# API keys or pay for building the clients
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _require_key(name: str) -> str:
+    key = os.getenv(name)
+    if not key:
+        raise ValueError(
+            f"{name} environment variable is not set. "
+            "Please create a .env file in the backend directory with your API key: "
+            f"{name}=your_api_key_here"
+        )
+    return key
+
+
+def _build_gemini():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        google_api_key=_require_key("GEMINI_API_KEY"),
+        model='gemini-2.0-flash',
+        temperature=0.7
+    )
+
+
+def _build_llama():
+    from langchain_groq import ChatGroq
+    return ChatGroq(
+        api_key=_require_key("GROQ_API_KEY"),
+        model='llama-3.3-70b-versatile',
+        temperature=0.7
+    )
+
+
+BUILDERS = {
+    "gemini": _build_gemini,
+    "llama": _build_llama
+}
+
+
+def get_client(name: str):
+    """
+    Return the named chat model ("gemini" or "llama"), wrapped in the LLM
+    response cache, creating it on first use.
+
+    Raises:
+        ValueError: If the provider's API key is missing or the client cannot be created
+    """
+    client = _clients.get(name)
+    if client is not None:
+        return client
+    with _clients_lock:
+        if name not in _clients:
+            try:
+                # Responses are served from the local LLM cache for repeated prompts
+                _clients[name] = with_cache(BUILDERS[name]())
+            except ValueError:
+                raise
+            except Exception as e:
+                raise ValueError(f"Failed to initialize language model {name}: {str(e)}")
+        return _clients[name]
+
+
+def set_client(name: str, client):
+    """Replace a client, e.g. with a stub for offline benchmarks"""
+    with _clients_lock:
+        _clients[name] = client
+
+
+def get_gemini():
+    return get_client("gemini")
+
+
+def get_llama():
+    return get_client("llama")
@@ -0,0 +1,233 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+from langchain_core.runnables import Runnable
+from llm_clients import get_client
+from llm_cache import is_cached
+import metrics
+
+# Providers in order of preference; the first available one gets every
+# request, the others are used for hedges and failover
+LLM_PROVIDERS = [name.strip() for name in os.getenv("LLM_PROVIDERS", "gemini,llama").split(",") if name.strip()]
+
+# Send a hedged request to the next provider once the first one has taken
+# longer than this percentile of its recent latencies
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# Delay used until a provider has LLM_HEDGE_MIN_SAMPLES latencies, and the
+# shortest delay ever used
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SECONDS", "10"))
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "1"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Largest fraction of recent requests that may send a hedge, so a slow
+# provider cannot double the load on the other one
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+
+PROVIDER_SECONDS = metrics.Histogram("llm_provider_seconds", "LLM requests per provider", ["provider", "outcome"])
+HEDGES = metrics.Counter("llm_hedges_total", "Hedged LLM requests, by the provider that answered first", ["winner"])
+FAILOVERS = metrics.Counter("llm_failovers_total", "LLM requests retried on another provider after an error", ["provider"])
+
+
+class LatencyTracker:
+    """Sliding window of successful request latencies for one provider"""
+
+    def __init__(self, window: int = LLM_LATENCY_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        with self.lock:
+            if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index]
+
+
+class ProviderRouter(Runnable):
+    """
+    Chat model that spreads each request over several providers.
+
+    A request goes to the preferred provider. If it has not answered within
+    the hedge delay (LLM_HEDGE_PERCENTILE of its recent latencies) and the
+    hedge budget allows, the same prompt is also sent to the next provider;
+    the first answer wins and the other request is cancelled. A provider that
+    errors (or cannot be created, e.g. without an API key) is failed over to
+    the next one. Streams are not hedged, and only fail over until their
+    first chunk.
+    """
+
+    def __init__(self, providers: List[str] = LLM_PROVIDERS, hedge: bool = LLM_HEDGE_ENABLED):
+        self.providers = list(providers)
+        self.hedge = hedge
+        self.trackers = {name: LatencyTracker() for name in self.providers}
+        # True for each recent request that sent a hedge
+        self.hedge_window = deque(maxlen=LLM_LATENCY_WINDOW)
+        self.lock = threading.Lock()
+        self.unavailable = set()
+        self.model_name = "router:" + ",".join(self.providers)
+        self.temperature = None
+
+    def _available(self) -> List[tuple]:
+        """(name, client) of every provider whose client can be created"""
+        clients = []
+        for name in self.providers:
+            try:
+                clients.append((name, get_client(name)))
+            except ValueError as e:
+                if name not in self.unavailable:
+                    self.unavailable.add(name)
+                    print(f"LLM provider {name} unavailable: {str(e)}")
+        if not clients:
+            raise ValueError("No LLM provider is available")
+        return clients
+
+    def hedge_delay(self, name: str) -> float:
+        delay = self.trackers[name].percentile(LLM_HEDGE_PERCENTILE)
+        if delay is None:
+            delay = LLM_HEDGE_DEFAULT_DELAY_SECONDS
+        return max(delay, LLM_HEDGE_MIN_DELAY_SECONDS)
+
+    def _take_hedge(self) -> bool:
+        """Record one request and whether it may hedge within LLM_HEDGE_BUDGET"""
+        with self.lock:
+            hedges = sum(self.hedge_window)
+            allowed = hedges + 1 <= LLM_HEDGE_BUDGET * (len(self.hedge_window) + 1)
+            self.hedge_window.append(allowed)
+            return allowed
+
+    def _record(self, name: str, seconds: float, outcome: str):
+        PROVIDER_SECONDS.observe(seconds, provider=name, outcome=outcome)
+        # Cache hits say nothing about the provider and would drag the hedge
+        # delay down to LLM_HEDGE_MIN_DELAY_SECONDS
+        if outcome == "ok":
+            self.trackers[name].record(seconds)
+
+    def invoke(self, input, config=None, **kwargs):
+        """Blocking call: failover only, no hedging"""
+        error = None
+        for name, client in self._available():
+            if error is not None:
+                FAILOVERS.inc(provider=name)
+            start = time.perf_counter()
+            try:
+                result = client.invoke(input, config, **kwargs)
+            except Exception as e:
+                self._record(name, time.perf_counter() - start, "error")
+                print(f"LLM provider {name} failed: {str(e)}")
+                error = e
+                continue
+            self._record(name, time.perf_counter() - start, "cached" if is_cached(result) else "ok")
+            return result
+        raise error
+
+    async def _call(self, name: str, client, input, config, kwargs):
+        start = time.perf_counter()
+        try:
+            result = await client.ainvoke(input, config, **kwargs)
+        except asyncio.CancelledError:
+            self._record(name, time.perf_counter() - start, "cancelled")
+            raise
+        except Exception:
+            self._record(name, time.perf_counter() - start, "error")
+            raise
+        self._record(name, time.perf_counter() - start, "cached" if is_cached(result) else "ok")
+        return result
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        candidates = self._available()
+        pending = {}
+        error = None
+        # The hedge delay passed (and the budget was consulted) / a hedge was sent
+        hedge_due = False
+        hedge_sent = False
+        try:
+            while candidates or pending:
+                if not pending:
+                    # Nothing in flight: start the next provider (the first
+                    # request, or a failover after errors)
+                    name, client = candidates.pop(0)
+                    pending[asyncio.create_task(self._call(name, client, input, config, kwargs))] = name
+                    if error is not None:
+                        FAILOVERS.inc(provider=name)
+
+                timeout = None
+                if candidates and self.hedge and not hedge_due:
+                    timeout = self.hedge_delay(next(iter(pending.values())))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Slow answer: hedge once on the next provider, if the budget allows
+                    hedge_due = True
+                    if self._take_hedge():
+                        hedge_sent = True
+                        name, client = candidates.pop(0)
+                        pending[asyncio.create_task(self._call(name, client, input, config, kwargs))] = name
+                    continue
+
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        if hedge_sent:
+                            HEDGES.inc(winner=name)
+                        return task.result()
+                    error = task.exception()
+                    print(f"LLM provider {name} failed: {str(error)}")
+            raise error
+        finally:
+            # Cancel the losing (or abandoned) requests
+            for task in pending:
+                task.cancel()
+            if self.hedge and not hedge_due:
+                with self.lock:
+                    self.hedge_window.append(False)
+
+    async def astream(self, input, config=None, **kwargs):
+        error = None
+        for name, client in self._available():
+            if error is not None:
+                FAILOVERS.inc(provider=name)
+            start = time.perf_counter()
+            started = False
+            cached = False
+            try:
+                async for chunk in client.astream(input, config, **kwargs):
+                    started = True
+                    cached = is_cached(chunk)
+                    yield chunk
+            except asyncio.CancelledError:
+                self._record(name, time.perf_counter() - start, "cancelled")
+                raise
+            except Exception as e:
+                self._record(name, time.perf_counter() - start, "error")
+                # Chunks already sent cannot be taken back from another provider
+                if started:
+                    raise
+                print(f"LLM provider {name} failed: {str(e)}")
+                error = e
+                continue
+            self._record(name, time.perf_counter() - start, "cached" if cached else "ok")
+            return
+        raise error
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_llm():
+    """The chat model the pipeline sends its prompts to"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ProviderRouter()
+    return _router
@@ -1,27 +1,39 @@
+import time
+# Taken before the heavy imports below so startup times include them
+STARTED_AT = time.time()
+
 from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Request
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import json
 import os
 import base64
-from pathlib import Path
-from extract import extract_pdf_content
-from deidentify import process_json_file
-from llm_chain import get_summary
+import hashlib
+import uuid
+from extract import extract_pdf_content, shutdown_page_pool
+from deidentify import deidentify_document, deidentify_documents, ownership_precheck, verify_ownership, warm_up
+from llm_chain import asummarize
+from result_cache import result_cache, cache_key
+from uploads import read_pdf_upload, read_pdf_uploads
+from workers import (
+    run_cpu, run_io, shutdown_executors, set_cpu_initializer, CPU_EXECUTOR, CPU_WORKERS,
+    EXTRACT_TIMEOUT_SECONDS, DEIDENTIFY_TIMEOUT_SECONDS, SUMMARY_TIMEOUT_SECONDS
+)
 from auth import auth_handler, get_current_user
+from audit import audit_log
+from jobs import job_queue
+from paths import DATA_DIR
+import metrics
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from typing import Optional, Dict
 from datetime import datetime
-import threading
-import re
 
 # Load environment variables
 load_dotenv()
 
 # Create data directory if it doesn't exist
-DATA_DIR = Path("data")
 DATA_DIR.mkdir(exist_ok=True)
 
 app = FastAPI(title="PDF upload API")
@@ -53,35 +65,111 @@ class LoginCredentials(BaseModel):
 
 class FileUpload(BaseModel):
     file_data: str
+    # Stream the summary as it is generated (see verify_and_summarize)
+    stream: bool = False
+
+# Intermediate upload artifacts are only written to disk when enabled, each
+# request under its own directory
+PERSIST_ARTIFACTS = os.getenv("PERSIST_ARTIFACTS", "false").lower() in ("1", "true", "yes")
+ARTIFACTS_DIR = DATA_DIR / "requests"
+
+# Documents of /upload/batch requests verified and summarized at once,
+# shared by all batches
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+batch_semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
 
-# Audit log file path
-AUDIT_LOG_FILE = DATA_DIR / "audit_log.json"
-AUDIT_LOG_LOCK = threading.Lock()
+# Loading spaCy into the CPU workers at startup: "background" (default)
+# accepts requests while the workers warm up, "blocking" waits for them
+# before serving, "off" loads the model on the first upload
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background").lower()
 
+# Pages of long PDFs are only split across the extract page pool when
+# extraction runs on a CPU thread; a CPU worker process starting its own pool
+# would multiply the processes past CPU_WORKERS
+EXTRACT_PARALLEL = CPU_EXECUTOR == "thread"
 
-def normalize(s):
-    """Custom normalisation function"""
-    return re.sub(r'[^a-zA-Z0-9]', '', s or '').lower()
+NOT_OWN_RECORD_MESSAGE = "No matching PHI information found. This document may not belong to you."
+
+
+def persist_artifact(request_id, name, data):
+    """Write one intermediate upload artifact to the request's own directory"""
+    request_dir = ARTIFACTS_DIR / request_id
+    request_dir.mkdir(parents=True, exist_ok=True)
+    with open(request_dir / name, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
 
 
 def append_audit_log(entry):
-    with AUDIT_LOG_LOCK:
-        try:
-            if AUDIT_LOG_FILE.exists():
-                with open(AUDIT_LOG_FILE, 'r', encoding='utf-8') as f:
-                    logs = json.load(f)
-            else:
-                logs = []
-        except Exception:
-            logs = []
-        logs.append(entry)
-        with open(AUDIT_LOG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(logs, f, indent=2, ensure_ascii=False)
+    """Queue an audit entry; the audit log writes it in the background"""
+    audit_log.append(entry)
+
+async def warm_up_workers():
+    """
+    Start every CPU worker; each one runs warm_up as its initializer before
+    taking a task. With CPU_EXECUTOR=thread the shared model is warmed once.
+    """
+    start = time.perf_counter()
+    if CPU_EXECUTOR == "thread":
+        tasks = [run_cpu(warm_up, timeout=DEIDENTIFY_TIMEOUT_SECONDS)]
+    else:
+        # Concurrent tasks make the pool start all CPU_WORKERS processes
+        tasks = [run_cpu(os.getpid, timeout=DEIDENTIFY_TIMEOUT_SECONDS) for _ in range(CPU_WORKERS)]
+    try:
+        await asyncio.gather(*tasks)
+    except Exception as e:
+        print(f"Warm-up failed: {str(e)}")
+        return
+    metrics.STARTUP_SECONDS.set(time.time() - STARTED_AT, phase="warm")
+    print(f"Warm-up finished in {time.perf_counter() - start:.2f}s")
+
+# Background warm-up, referenced so it is not garbage-collected while it runs
+_warm_up_task = None
+
+@app.on_event("startup")
+async def startup():
+    global _warm_up_task
+    if STARTUP_WARMUP != "off":
+        # Workers started later (e.g. after a crash) warm up as well
+        set_cpu_initializer(warm_up)
+        if STARTUP_WARMUP == "blocking":
+            await warm_up_workers()
+        else:
+            _warm_up_task = asyncio.create_task(warm_up_workers())
+    await job_queue.start(lambda *args: instrumented(process_pdf(*args), "/jobs"))
+    ready = time.time() - STARTED_AT
+    metrics.STARTUP_SECONDS.set(ready, phase="ready")
+    print(f"Ready to serve {ready:.2f}s after start")
+
+_first_request_seen = False
+
+@app.middleware("http")
+async def report_time_to_first_request(request: Request, call_next):
+    global _first_request_seen
+    if not _first_request_seen:
+        _first_request_seen = True
+        elapsed = time.time() - STARTED_AT
+        metrics.STARTUP_SECONDS.set(elapsed, phase="first_request")
+        print(f"Time to first request: {elapsed:.2f}s")
+    return await call_next(request)
+
+@app.on_event("shutdown")
+async def shutdown():
+    if _warm_up_task is not None:
+        _warm_up_task.cancel()
+    await job_queue.stop()
+    audit_log.close()
+    shutdown_executors()
+    shutdown_page_pool()
 
 @app.get("/hello")
 async def root():
     return {"message": "Server up and running! You got this!"}
 
+@app.get("/metrics")
+async def get_metrics():
+    """Pipeline metrics in the Prometheus text exposition format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/me")
 async def get_me(current_user: dict = Depends(get_current_user)):
     user_data = auth_handler.get_user_data(current_user["username"])
@@ -95,7 +183,7 @@ async def get_me(current_user: dict = Depends(get_current_user)):
 @app.post("/register")
 async def register(user_data: UserCreate):
     try:
-        auth_handler.register_user(
+        await auth_handler.aregister_user(
             user_data.username,
             user_data.password,
             {
@@ -120,7 +208,7 @@ async def register(user_data: UserCreate):
 async def login(user_data: LoginCredentials):
     try:
         # Authenticate with plain credentials
-        if auth_handler.authenticate_user(user_data.username, user_data.password):
+        if await auth_handler.aauthenticate_user(user_data.username, user_data.password):
             token = auth_handler.encode_token(user_data.username)
             append_audit_log({
                 "event": "login",
@@ -174,116 +262,456 @@ async def logout(current_user: dict = Depends(get_current_user)):
             status_code=400
         )
 
+async def process_pdf(pdf_source, current_user, pdf_hash, stream=False):
+    """
+    Run extraction, de-identification, PHI verification and summarization
+    for one uploaded PDF, yielding NDJSON progress lines.
+
+    Args:
+        pdf_source: PDF as bytes, or the path of the spooled upload
+        current_user: Authenticated user the document must belong to
+        pdf_hash: sha256 hex digest of the PDF bytes, used as the result cache key
+        stream: Stream the summary as it is generated
+    """
+    # Normalized identifiers of the user, precomputed once per user
+    fingerprint = auth_handler.get_user_fingerprint(current_user["username"])
+    if fingerprint is None:
+        yield json.dumps({"progress": "User data not found", "error": True}) + "\n"
+        return
+
+    key = cache_key(pdf_hash)
+    cached = None
+    if result_cache is not None:
+        cached = await run_io(result_cache.get, key)
+        metrics.CACHE_REQUESTS.inc(cache="result", result="miss" if cached is None else "hit")
+
+    if cached is not None:
+        # Same PDF already processed: reuse the de-identification
+        deidentified_data = cached["deidentified"]
+        phi_info = cached["phi_info"]
+        yield json.dumps({"progress": "Cache hit: reusing previous analysis", "cache_hit": True}) + "\n"
+    else:
+        try:
+            # PDF data extraction
+            result, processing_duration = await run_cpu(
+                extract_pdf_content, pdf_source, parallel=EXTRACT_PARALLEL, timeout=EXTRACT_TIMEOUT_SECONDS
+            )
+            result["processing_duration"] = processing_duration
+            yield json.dumps({"progress": "PDF extraction completed"}) + "\n"
+        except Exception as extract_error:
+            yield json.dumps({"progress": f"PDF extraction failed: {str(extract_error)}", "error": True}) + "\n"
+            return
+    
+    try:
+        if cached is None:
+            # Each request keeps its own state in memory
+            request_id = uuid.uuid4().hex
+            if PERSIST_ARTIFACTS:
+                persist_artifact(request_id, "pdf_analysis_result.json", result)
+                yield json.dumps({"progress": "Analysis result saved"}) + "\n"
+
+            # Cheap ownership pass so documents that clearly belong to someone
+            # else are rejected before any NER work
+            outcome, precheck_results = await run_cpu(
+                ownership_precheck, result, fingerprint, timeout=DEIDENTIFY_TIMEOUT_SECONDS
+            )
+            if outcome == "reject":
+                audit_precheck_rejection(current_user, precheck_results)
+                yield json.dumps({"progress": NOT_OWN_RECORD_MESSAGE, "error": True}) + "\n"
+                return
+
+            # De identification of the extracted content
+            try:
+                deidentified_data, phi_info = await run_cpu(
+                    deidentify_document, result, timeout=DEIDENTIFY_TIMEOUT_SECONDS
+                )
+            except Exception as deidentify_error:
+                print(f"Error during de-identification: {str(deidentify_error)}")
+                yield json.dumps({"progress": "Failed to process the file", "error": True}) + "\n"
+                return
+            if PERSIST_ARTIFACTS:
+                persist_artifact(request_id, "deidentified_pdf_analysis.json", deidentified_data)
+            yield json.dumps({"progress": "De-identification completed"}) + "\n"
+
+            if result_cache is not None:
+                try:
+                    await run_io(result_cache.put, key, {
+                        "deidentified": deidentified_data,
+                        "phi_info": phi_info
+                    })
+                except Exception as cache_error:
+                    print(f"Failed to cache upload result: {str(cache_error)}")
+
+        async for line in verify_and_summarize(key, cached, deidentified_data, phi_info, fingerprint, current_user, stream):
+            yield line
+
+    except Exception as process_error:
+        yield json.dumps({"progress": f"Processing failed: {str(process_error)}", "error": True}) + "\n"
+        return
+
+def audit_precheck_rejection(current_user, precheck_results):
+    append_audit_log({
+        "event": "upload",
+        "username": current_user["username"],
+        "timestamp": datetime.utcnow().isoformat(),
+        "is_own_record": False,
+        "phi_verification": precheck_results,
+        "precheck": "reject",
+        "cache_hit": False
+    })
+
+async def instrumented(stream, endpoint):
+    """Pass a progress stream through, recording upload_seconds and uploads_in_flight"""
+    start = time.perf_counter()
+    metrics.UPLOADS_IN_FLIGHT.inc(endpoint=endpoint)
+    try:
+        async for line in stream:
+            yield line
+    finally:
+        metrics.UPLOADS_IN_FLIGHT.dec(endpoint=endpoint)
+        metrics.UPLOAD_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+
+async def verify_and_summarize(key, cached, deidentified_data, phi_info, fingerprint, current_user, stream=False):
+    """
+    PHI ownership verification and summarization of a de-identified
+    document, yielding NDJSON progress lines.
+
+    With stream, partial summary chunks are sent as "summary_delta" lines
+    while the summary is generated. Validation runs once a summary is
+    complete; if it fails, a "summary_retracted" line tells the client to
+    discard that attempt's chunks before the next attempt streams. The
+    "summary" of the final "done" line always replaces the streamed text.
+
+    Args:
+        key: Result cache key of the document
+        cached: Result cache entry the document came from, or None
+        fingerprint: Normalized identifiers of current_user
+        stream: Stream the summary as it is generated
+    """
+    try:
+        # Looser PHI verification
+        verification_results = verify_ownership(phi_info, fingerprint)
+
+        # Allow if at least one field matches
+        is_own_record = any(verification_results.values())
+        append_audit_log({
+            "event": "upload",
+            "username": current_user["username"],
+            "timestamp": datetime.utcnow().isoformat(),
+            "is_own_record": is_own_record,
+            "phi_verification": verification_results,
+            "cache_hit": cached is not None
+        })
+        if not is_own_record:
+            yield json.dumps({"progress": NOT_OWN_RECORD_MESSAGE, "error": True}) + "\n"
+            return
+
+        yield json.dumps({"progress": "PHI verified"}) + "\n"
+
+        # Generate summary only after verification; a validated summary of
+        # the same document is reused
+        summary = cached.get("summary") if cached is not None else None
+        if summary is not None:
+            yield json.dumps({"progress": "Summary generated", "summary": summary, "phi_verification": verification_results, "cache_hit": True, "done": True}) + "\n"
+            return
+
+        # Awaited directly on the event loop; if the client disconnects the
+        # stream is cancelled and so are the in-flight LLM requests
+        try:
+            if stream:
+                events = asyncio.Queue()
+                summary_task = asyncio.create_task(
+                    asyncio.wait_for(asummarize(deidentified_data, on_event=events.put), SUMMARY_TIMEOUT_SECONDS)
+                )
+                summary_task.add_done_callback(lambda _: events.put_nowait(None))
+                try:
+                    while True:
+                        event = await events.get()
+                        if event is None:
+                            break
+                        yield json.dumps(event) + "\n"
+                    summary, validated = summary_task.result()
+                finally:
+                    summary_task.cancel()
+            else:
+                summary, validated = await asyncio.wait_for(asummarize(deidentified_data), SUMMARY_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            yield json.dumps({"progress": f"Summary generation timed out after {SUMMARY_TIMEOUT_SECONDS:g}s", "error": True}) + "\n"
+            return
+        if validated and result_cache is not None:
+            try:
+                await run_io(result_cache.update, key, summary=summary)
+            except Exception as cache_error:
+                print(f"Failed to cache summary: {str(cache_error)}")
+        yield json.dumps({"progress": "Summary generated", "summary": summary, "phi_verification": verification_results, "done": True}) + "\n"
+
+    except Exception as process_error:
+        yield json.dumps({"progress": f"Processing failed: {str(process_error)}", "error": True}) + "\n"
+        return
+
+async def process_batch(pdf_sources, filenames, pdf_hashes, current_user):
+    """
+    Process several PDFs together, yielding NDJSON progress lines tagged
+    with the document index and filename.
+
+    Documents are extracted concurrently, then every document that needs it
+    is de-identified in one batched deidentify_documents call. Verification
+    and summarization run per document, at most BATCH_CONCURRENCY at once
+    across all batches.
+    """
+    count = len(pdf_sources)
+
+    def document_line(index, event):
+        return json.dumps({"document": index, "filename": filenames[index], **event}) + "\n"
+
+    yield json.dumps({"progress": f"Received {count} files", "documents": count}) + "\n"
+
+    fingerprint = auth_handler.get_user_fingerprint(current_user["username"])
+    if fingerprint is None:
+        yield json.dumps({"progress": "User data not found", "error": True}) + "\n"
+        return
+
+    keys = [cache_key(pdf_hash) for pdf_hash in pdf_hashes]
+
+    async def load(index):
+        """Returns (index, cache entry, extraction result, precheck outcome, error)"""
+        if result_cache is not None:
+            cached = await run_io(result_cache.get, keys[index])
+            metrics.CACHE_REQUESTS.inc(cache="result", result="miss" if cached is None else "hit")
+            if cached is not None:
+                return index, cached, None, None, None
+        try:
+            result, processing_duration = await run_cpu(
+                extract_pdf_content, pdf_sources[index], parallel=EXTRACT_PARALLEL, timeout=EXTRACT_TIMEOUT_SECONDS
+            )
+            result["processing_duration"] = processing_duration
+            outcome, precheck_results = await run_cpu(
+                ownership_precheck, result, fingerprint, timeout=DEIDENTIFY_TIMEOUT_SECONDS
+            )
+        except Exception as extract_error:
+            return index, None, None, None, extract_error
+        if outcome == "reject":
+            audit_precheck_rejection(current_user, precheck_results)
+        return index, None, result, outcome, None
+
+    cached_entries = {}
+    extracted = {}
+    for task in asyncio.as_completed([load(index) for index in range(count)]):
+        index, cached, result, outcome, error = await task
+        if cached is not None:
+            cached_entries[index] = cached
+            yield document_line(index, {"progress": "Cache hit: reusing previous analysis", "cache_hit": True})
+        elif error is not None:
+            yield document_line(index, {"progress": f"PDF extraction failed: {str(error)}", "error": True})
+        elif outcome == "reject":
+            yield document_line(index, {"progress": NOT_OWN_RECORD_MESSAGE, "error": True})
+        else:
+            extracted[index] = result
+            yield document_line(index, {"progress": "PDF extraction completed"})
+
+    # One de-identification pass over every extracted document
+    documents = {}
+    if extracted:
+        indices = sorted(extracted)
+        try:
+            deidentified = await run_cpu(
+                deidentify_documents, [extracted[index] for index in indices],
+                timeout=DEIDENTIFY_TIMEOUT_SECONDS * len(indices)
+            )
+        except Exception as deidentify_error:
+            print(f"Error during batch de-identification: {str(deidentify_error)}")
+            for index in indices:
+                yield document_line(index, {"progress": "Failed to process the file", "error": True})
+            deidentified = []
+        for index, (deidentified_data, phi_info) in zip(indices, deidentified):
+            if PERSIST_ARTIFACTS:
+                request_id = uuid.uuid4().hex
+                persist_artifact(request_id, "pdf_analysis_result.json", extracted[index])
+                persist_artifact(request_id, "deidentified_pdf_analysis.json", deidentified_data)
+            if result_cache is not None:
+                try:
+                    await run_io(result_cache.put, keys[index], {
+                        "deidentified": deidentified_data,
+                        "phi_info": phi_info
+                    })
+                except Exception as cache_error:
+                    print(f"Failed to cache upload result: {str(cache_error)}")
+            documents[index] = (None, deidentified_data, phi_info)
+            yield document_line(index, {"progress": "De-identification completed"})
+    for index, cached in cached_entries.items():
+        documents[index] = (cached, cached["deidentified"], cached["phi_info"])
+
+    # Per-document verification and summaries, merged into one stream
+    lines = asyncio.Queue()
+
+    async def finish(index):
+        try:
+            cached, deidentified_data, phi_info = documents[index]
+            async with batch_semaphore:
+                async for line in verify_and_summarize(keys[index], cached, deidentified_data, phi_info, fingerprint, current_user):
+                    await lines.put(document_line(index, json.loads(line)))
+        finally:
+            await lines.put(None)
+
+    tasks = [asyncio.create_task(finish(index)) for index in sorted(documents)]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            line = await lines.get()
+            if line is None:
+                remaining -= 1
+            else:
+                yield line
+    finally:
+        # Client disconnected: stop the remaining summaries
+        for task in tasks:
+            task.cancel()
+
+    yield json.dumps({"progress": "Batch completed", "documents": count, "done": True}) + "\n"
+
 @app.post("/upload")
 async def upload(
     file: FileUpload,
     current_user: dict = Depends(get_current_user)
 ):
-    def normalize(s):
-        return re.sub(r'[^a-zA-Z0-9]', '', s or '').lower()
     async def event_stream():
         try:
             yield json.dumps({"progress": "Received file data"}) + "\n"
             # Decode base64 file data
             try:
-                file_content = base64.b64decode(file.file_data)
+                with metrics.DECODE_SECONDS.time():
+                    file_content = base64.b64decode(file.file_data)
                 yield json.dumps({"progress": "File decoded successfully"}) + "\n"
             except Exception as decode_error:
                 yield json.dumps({"progress": f"File decoding failed: {str(decode_error)}", "error": True}) + "\n"
                 return
-            
-            try:
-                # PDF data extraction
-                result, processing_duration = extract_pdf_content(file_content)
-                result["processing_duration"] = processing_duration
-                yield json.dumps({"progress": "PDF extraction completed"}) + "\n"
-            except Exception as extract_error:
-                yield json.dumps({"progress": f"PDF extraction failed: {str(extract_error)}", "error": True}) + "\n"
-                return
-            
-            try:
-                # Use data directory for file storage
-                PDF_ANALYSIS_RESULT = DATA_DIR / "pdf_analysis_result.json"
-                DEIDENTIFIED_PDF_ANALYSIS = DATA_DIR / "deidentified_pdf_analysis.json"
 
-                with open(PDF_ANALYSIS_RESULT, 'w', encoding='utf-8') as json_file:
-                    json.dump(result, json_file, indent=4, ensure_ascii=False)
-                yield json.dumps({"progress": "Analysis result saved"}) + "\n"
-                
-                # De identification of the extracted content
-                success, phi_info = process_json_file(str(PDF_ANALYSIS_RESULT), str(DEIDENTIFIED_PDF_ANALYSIS))
-
-                if not success:
-                    yield json.dumps({"progress": "Failed to process the file", "error": True}) + "\n"
-                    return
-                yield json.dumps({"progress": "De-identification completed"}) + "\n"
-
-                # Get user data from the database or session
-                user_data = auth_handler.get_user_data(current_user["username"])
-                if not user_data:
-                    yield json.dumps({"progress": "User data not found", "error": True}) + "\n"
-                    return
-
-                # Looser PHI verification
-                user_name = normalize(user_data.get("name", ""))
-                user_email = (user_data.get("email", "") or "").lower()
-                user_phone = normalize(user_data.get("phone", ""))
-                user_dob = normalize(user_data.get("dob", ""))
-                user_ssn = normalize(user_data.get("ssn", ""))
-
-                name_match = any(normalize(name) in user_name or user_name in normalize(name) for name in phi_info.get("names", []))
-                email_match = any(email.lower() == user_email for email in phi_info.get("emails", []))
-                phone_match = any(normalize(phone) == user_phone for phone in phi_info.get("phones", []))
-                dob_match = any(normalize(dob) == user_dob for dob in phi_info.get("dates", []))
-                ssn_match = any(normalize(ssn) == user_ssn for ssn in phi_info.get("ssns", []))
-
-                verification_results = {
-                    "name_match": name_match,
-                    "email_match": email_match,
-                    "phone_match": phone_match,
-                    "dob_match": dob_match,
-                    "ssn_match": ssn_match
-                }
-
-                # Allow if at least one field matches
-                is_own_record = any(verification_results.values())
-                append_audit_log({
-                    "event": "upload",
-                    "username": current_user["username"],
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "is_own_record": is_own_record,
-                    "phi_verification": verification_results
-                })
-                if not is_own_record:
-                    yield json.dumps({"progress": "No matching PHI information found. This document may not belong to you.", "error": True}) + "\n"
-                    return
-
-                yield json.dumps({"progress": "PHI verified"}) + "\n"
-
-                # Generate summary only after verification
-                summary = get_summary(str(DEIDENTIFIED_PDF_ANALYSIS))
-                yield json.dumps({"progress": "Summary generated", "summary": summary, "phi_verification": verification_results, "done": True}) + "\n"
-
-            except Exception as process_error:
-                yield json.dumps({"progress": f"Processing failed: {str(process_error)}", "error": True}) + "\n"
-                return
+            pdf_hash = hashlib.sha256(file_content).hexdigest()
+            async for line in process_pdf(file_content, current_user, pdf_hash, file.stream):
+                yield line
         except Exception as e:
             yield json.dumps({"progress": f"Upload Failed: {str(e)}", "error": True}) + "\n"
             return
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+    return StreamingResponse(instrumented(event_stream(), "/upload"), media_type="text/event-stream")
 
-# Dependency for protected routes
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer())):
-    """Dependency to get current authenticated user"""
+@app.post("/upload/file")
+async def upload_file(
+    request: Request,
+    stream: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Upload a PDF as a raw application/pdf body or as multipart/form-data.
+
+    The body is streamed into a size-capped spool and rejected early if it
+    is too large or not a PDF, instead of arriving base64-encoded in JSON.
+    ?stream=true streams the summary as it is generated.
+    """
+    spool = await read_pdf_upload(request)
     try:
-        username = auth_handler.decode_token(credentials.credentials)
-        return {"username": username}
-    except HTTPException as e:
-        raise e
-    except Exception as e:
-        raise HTTPException(
-            status_code=401,
-            detail="Invalid authentication credentials"
-        )
+        pdf_source = spool.finish()
+    except Exception:
+        spool.cleanup()
+        raise
 
+    async def event_stream():
+        try:
+            yield json.dumps({"progress": "Received file data"}) + "\n"
+            async for line in process_pdf(pdf_source, current_user, spool.sha256.hexdigest(), stream):
+                yield line
+        except Exception as e:
+            yield json.dumps({"progress": f"Upload Failed: {str(e)}", "error": True}) + "\n"
+            return
+        finally:
+            spool.cleanup()
+    return StreamingResponse(instrumented(event_stream(), "/upload/file"), media_type="text/event-stream")
+
+@app.post("/upload/batch")
+async def upload_batch(
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Upload several PDFs as the file parts of one multipart/form-data body.
+
+    Every progress line carries the "document" index (order of the parts)
+    and "filename" it belongs to; the last line has "done" without a
+    document index.
+    """
+    spools = await read_pdf_uploads(request)
+    try:
+        pdf_sources = [spool.finish() for spool in spools]
+    except Exception:
+        for spool in spools:
+            spool.cleanup()
+        raise
+
+    async def event_stream():
+        try:
+            async for line in process_batch(
+                pdf_sources,
+                [spool.filename for spool in spools],
+                [spool.sha256.hexdigest() for spool in spools],
+                current_user
+            ):
+                yield line
+        except Exception as e:
+            yield json.dumps({"progress": f"Upload Failed: {str(e)}", "error": True}) + "\n"
+            return
+        finally:
+            for spool in spools:
+                spool.cleanup()
+    return StreamingResponse(instrumented(event_stream(), "/upload/batch"), media_type="text/event-stream")
+
+@app.post("/jobs")
+async def create_job(
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Queue a PDF (raw application/pdf or multipart/form-data body) for
+    background processing. Progress is read from /jobs/{job_id}/events.
+    """
+    spool = await read_pdf_upload(request)
+    try:
+        pdf_source = spool.finish()
+        job_id = await job_queue.submit(current_user["username"], pdf_source, spool.sha256.hexdigest())
+    finally:
+        spool.cleanup()
+    return JSONResponse(content={"job_id": job_id, "status": "queued"}, status_code=202)
 
+async def get_user_job(job_id: str, current_user: dict):
+    job = await run_io(job_queue.store.get, job_id)
+    # Other users' jobs are reported as missing rather than forbidden
+    if job is None or job["username"] != current_user["username"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await get_user_job(job_id, current_user)
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"]
+    }
+
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(
+    job_id: str,
+    after: int = 0,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Replay the job's NDJSON progress events after seq `after`, then follow
+    new ones until the job finishes. Each event carries its seq, so a client
+    that disconnects resumes with ?after=<last seq>.
+    """
+    await get_user_job(job_id, current_user)
+
+    async def event_stream():
+        async for event in job_queue.events(job_id, after):
+            yield json.dumps(event) + "\n"
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
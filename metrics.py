@@ -0,0 +1,223 @@
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds for latency histograms, from regex passes over one
+# page up to whole LLM summaries
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Observations made inside run_journaled() go to a per-thread journal instead
+# of the registry, so worker processes can send them back to the API process
+_local = threading.local()
+
+
+class Metric(ABC):
+    """Base for a labelled metric in the registry"""
+
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _record(self, op: str, value: float, labels: Dict[str, str]):
+        self._record_key(op, self._key(labels), value)
+
+    def _record_key(self, op: str, key: Tuple[str, ...], value: float):
+        journal = getattr(_local, "journal", None)
+        if journal is not None:
+            journal.append((self.name, op, key, value))
+        else:
+            self._apply(op, key, value)
+
+    @abstractmethod
+    def _apply(self, op: str, key: Tuple[str, ...], value: float):
+        pass
+
+    def _labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        pass
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return lines + self.samples()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        self._record("inc", amount, labels)
+
+    def _apply(self, op, key, value):
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self):
+        with self.lock:
+            return [f"{self.name}{self._labels(key)} {value:g}" for key, value in sorted(self.values.items())]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        self._record("inc", amount, labels)
+
+    def dec(self, amount: float = 1, **labels):
+        self._record("inc", -amount, labels)
+
+    def set(self, value: float, **labels):
+        self._record("set", value, labels)
+
+    def _apply(self, op, key, value):
+        with self.lock:
+            if op == "set":
+                self.values[key] = value
+            else:
+                self.values[key] = self.values.get(key, 0) + value
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self):
+        with self.lock:
+            return [f"{self.name}{self._labels(key)} {value:g}" for key, value in sorted(self.values.items())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, **labels):
+        self._record("observe", value, labels)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _apply(self, op, key, value):
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per-bucket counts (not cumulative) plus +Inf, then sum
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    def samples(self):
+        lines = []
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    labels = self._labels(key, 'le="%g"' % bound)
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                cumulative += counts[-1]
+                labels = self._labels(key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{self._labels(key)} {total:.6f}")
+                lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric: Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def replay(self, journal: Optional[List[Tuple[str, str, Tuple[str, ...], float]]]):
+        """Apply observations journaled in a worker process"""
+        for name, op, key, value in journal or ():
+            metric = self.metrics.get(name)
+            if metric is not None:
+                metric._record_key(op, key, value)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def run_journaled(func: Callable, *args, **kwargs) -> Tuple[Any, List]:
+    """
+    Call func with this thread's observations journaled instead of applied.
+
+    Returns (result, journal); pass the journal to replay() in the process
+    that serves /metrics.
+    """
+    previous = getattr(_local, "journal", None)
+    _local.journal = []
+    try:
+        result = func(*args, **kwargs)
+        return result, _local.journal
+    finally:
+        _local.journal = previous
+
+
+REGISTRY = Registry()
+
+
+def replay(journal):
+    REGISTRY.replay(journal)
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# Pipeline metrics
+UPLOAD_SECONDS = Histogram("upload_seconds", "Time from receiving an upload to the last progress event", ["endpoint"])
+UPLOADS_IN_FLIGHT = Gauge("uploads_in_flight", "Uploads whose progress stream is still open", ["endpoint"])
+DECODE_SECONDS = Histogram("upload_decode_seconds", "Base64 decoding of /upload bodies")
+EXTRACTION_SECONDS = Histogram("pdf_extraction_seconds", "extract_pdf_content per document")
+TABLE_DETECTION_SECONDS = Histogram("table_detection_seconds", "PyMuPDF find_tables and extraction per page")
+NER_SECONDS = Histogram("ner_seconds", "spaCy nlp.pipe per deidentify_texts batch")
+REGEX_MASKING_SECONDS = Histogram("regex_masking_seconds", "Regex PHI detection and masking per deidentify_texts batch")
+PHI_VERIFICATION_SECONDS = Histogram("phi_verification_seconds", "PHI ownership checks", ["stage"])
+LLM_CALL_SECONDS = Histogram("llm_call_seconds", "Individual LLM calls", ["call", "outcome"])
+SUMMARY_ATTEMPTS = Counter("summary_attempts_total", "Validated generation attempts; failed ones are retried with critique feedback", ["stage", "outcome"])
+CACHE_REQUESTS = Counter("cache_requests_total", "Result and LLM response cache lookups", ["cache", "result"])
+AUDIT_WRITE_SECONDS = Histogram("audit_write_seconds", "Writing one batch of audit entries")
+STARTUP_SECONDS = Gauge("startup_seconds", "Seconds from process start until the app was ready, warmed up and served its first request", ["phase"])
+AUDIT_ENTRIES = Counter("audit_entries_total", "Audit entries written")
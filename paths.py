@@ -0,0 +1,5 @@
+from pathlib import Path
+
+# Root for everything the service persists (users, jobs, caches, audit, uploads);
+# each store creates its own subdirectory under it
+DATA_DIR = Path("data")
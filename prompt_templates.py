@@ -38,8 +38,8 @@ def structure_prompt_template(RAW_DATA: str, CRITIQUE_FEEDBACK: str = None) -> s
     
     return base_prompt
 
-def summary_prompt_template(STRUCTURED_DATA: str) -> str:
-    return """
+def summary_prompt_template(STRUCTURED_DATA: str, CRITIQUE_FEEDBACK: str = None) -> str:
+    base_prompt = """
     You are a medical assistant.
     Given the structured data from a CBC report, provide a clear and easy-to-understand summary for a patient.
     Use layman terms and explain what each test means and whether it's in a healthy range or not.
@@ -53,6 +53,17 @@ def summary_prompt_template(STRUCTURED_DATA: str) -> str:
     A friendly, understandable paragraph explaining the CBC report to the patient.
     """
 
+    if CRITIQUE_FEEDBACK:
+        critique_section = f"""
+        Previous Critique Feedback:
+        {CRITIQUE_FEEDBACK}
+        
+        Please ensure to only mention values that appear in the structured data.
+        """
+        base_prompt += critique_section
+
+    return base_prompt
+
 def validation_prompt_template(source_data: str, generated_summary: str) -> str:
     return """
 You are a helpful and precise medical assistant.
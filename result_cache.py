@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+from paths import DATA_DIR
+
+# Bump whenever extraction, de-identification or the prompts change so that
+# results produced by an older pipeline are not reused
+PIPELINE_VERSION = "2"
+
+RESULT_CACHE_DIR = DATA_DIR / "cache" / "results"
+
+# Off by default: entries hold the PHI found in each document (needed to
+# verify ownership on a hit), so enabling it needs a protected data directory
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def cache_key(pdf_hash: str) -> str:
+    """Cache key for a PDF, given the sha256 hex digest of its decoded bytes"""
+    return hashlib.sha256(f"{PIPELINE_VERSION}:{pdf_hash}".encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    On-disk, content-addressed store of pipeline results.
+
+    Each entry is one JSON file holding the de-identified document with its
+    PHI and, once validated, the summary. The raw extraction is never stored. Entries expire
+    after ttl_seconds; when the store grows past max_bytes the least recently
+    used entries (by file mtime, refreshed on every hit) are removed.
+    """
+
+    def __init__(self, directory: Path = RESULT_CACHE_DIR, max_bytes: int = RESULT_CACHE_MAX_BYTES, ttl_seconds: int = RESULT_CACHE_TTL_SECONDS):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry.get("created_at", 0) > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        if self._expired(entry):
+            self.delete(key)
+            return None
+
+        # Mark as recently used for LRU eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        entry = dict(entry)
+        entry.setdefault("created_at", time.time())
+        entry["pipeline_version"] = PIPELINE_VERSION
+
+        # Write to a private temp file and rename so readers never see a
+        # partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self.evict()
+
+    def update(self, key: str, **fields):
+        """Add fields (e.g. the validated summary) to an existing entry"""
+        with self.lock:
+            entry = self.get(key)
+            if entry is None:
+                return
+            entry.update(fields)
+            self.put(key, entry)
+
+    def delete(self, key: str):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        now = time.time()
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = 0
+        live = []
+        for mtime, size, path in entries:
+            # Entries not used within the TTL are expired as well
+            if now - mtime > self.ttl_seconds:
+                path.unlink(missing_ok=True)
+            else:
+                live.append((mtime, size, path))
+                total += size
+
+        for mtime, size, path in sorted(live):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+result_cache = ResultCache() if RESULT_CACHE_ENABLED else None
@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+pytest.importorskip("spacy")
+pytest.importorskip("fitz")
+pytest.importorskip("fastapi")
+
+from deidentify import mask_spans, phi_info_from_spans, regex_phi_spans, resolve_overlaps
+
+
+def test_dob_and_date_overlap_are_masked_once():
+    text = "DOB: 03/04/1984, seen 12/05/2023."
+    spans = regex_phi_spans(text)
+    assert resolve_overlaps(spans) == [(0, 15, "DOB"), (22, 32, "DATE")]
+    assert mask_spans(text, spans) == "{{DOB}}, seen {{DATE}}."
+    assert phi_info_from_spans(text, spans)["dates"] == ["DOB: 03/04/1984", "03/04/1984", "12/05/2023"]
+
+
+def test_ner_date_covering_regex_date_is_merged():
+    text = "Collected 12/05/2023 10:30 by lab"
+    # NER date with the time, regex date without it
+    spans = [(10, 26, "DATE")] + regex_phi_spans(text)
+    resolved = resolve_overlaps(spans)
+    assert resolved == [(10, 26, "DATE")]
+    assert text[10:26] == "12/05/2023 10:30"
+    assert mask_spans(text, spans) == "Collected {{DATE}} by lab"
+
+
+def test_same_span_prefers_regex_label_over_ner():
+    text = "Seen by Dr. Jane Doe"
+    spans = [(12, 20, "PERSON")] + regex_phi_spans(text)
+    assert resolve_overlaps(spans) == [(8, 20, "NAME_PREFIX")]
+    assert resolve_overlaps([(8, 20, "PERSON"), (8, 20, "NAME_PREFIX")]) == [(8, 20, "NAME_PREFIX")]
+    assert mask_spans(text, spans) == "Seen by {{NAME_PREFIX}}"
+
+
+def test_email_starting_with_phone_number_is_found_whole():
+    text = "Email: 9876543210@gmail.com"
+    spans = regex_phi_spans(text)
+    assert phi_info_from_spans(text, spans)["emails"] == ["9876543210@gmail.com"]
+    assert mask_spans(text, spans) == "Email: {{EMAIL}}"
+
+
+def test_many_spans_join_in_text_order():
+    line = "Patient 555-123-4567 seen 12/05/2023 email a@b.com\n"
+    text = line * 2000
+    spans = regex_phi_spans(text)
+    random.Random(0).shuffle(spans)
+    assert mask_spans(text, spans) == "Patient {{PHONE}} seen {{DATE}} email {{EMAIL}}\n" * 2000
+    resolved = resolve_overlaps(spans)
+    assert len(resolved) == 3 * 2000
+    assert [text[start:end] for start, end, _ in resolved[:3]] == ["555-123-4567", "12/05/2023", "a@b.com"]
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip("spacy")
+pytest.importorskip("fitz")
+pytest.importorskip("fastapi")
+
+from deidentify import deidentify_texts, needs_ner
+
+
+@pytest.mark.parametrize("cell", ["12-05-2023", "1984-03-17", "05.12.2023", "12/05/23"])
+def test_date_only_cells_are_masked_and_collected(cell):
+    # Date-only cells take the numeric fast path, so the regex must catch them
+    assert not needs_ner(cell)
+    [(masked, phi_info)] = deidentify_texts([cell])
+    assert masked == "{{DATE}}"
+    assert phi_info["dates"] == [cell]
+
+
+@pytest.mark.parametrize("cell", ["10.5-12.5", "13.0-17.0 g/dL", "150-400", "4.5"])
+def test_reference_ranges_are_not_dates(cell):
+    [(masked, phi_info)] = deidentify_texts([cell])
+    assert masked == cell
+    assert phi_info["dates"] == []
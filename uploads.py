@@ -0,0 +1,254 @@
+import hashlib
+import os
+import tempfile
+from typing import Callable, List, Optional, Union
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+from paths import DATA_DIR
+
+UPLOAD_TMP_DIR = DATA_DIR / "uploads"
+UPLOAD_TMP_DIR.mkdir(parents=True, exist_ok=True)
+
+# Largest PDF accepted, and how much of it is kept in memory before spilling
+# to a temporary file
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(2 * 1024 * 1024)))
+
+# Readers accept the %PDF- header anywhere in the first 1024 bytes
+PDF_MAGIC = b"%PDF-"
+PDF_HEADER_WINDOW = 1024
+
+# Allowance for multipart boundaries and part headers in Content-Length
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+PDF_CONTENT_TYPES = (b"application/pdf", b"application/octet-stream")
+
+# Most PDFs accepted in one /upload/batch request
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "50"))
+
+
+class SpooledPDF:
+    """
+    PDF body written in chunks: kept in memory up to UPLOAD_SPOOL_BYTES and
+    spilled to a temporary file beyond that.
+    """
+
+    def __init__(self, max_bytes: int = MAX_UPLOAD_BYTES, spool_bytes: int = UPLOAD_SPOOL_BYTES):
+        self.max_bytes = max_bytes
+        self.spool_bytes = spool_bytes
+        self.size = 0
+        self.path = None
+        # Multipart filename, if the PDF arrived as a named part
+        self.filename = None
+        # sha256 of the PDF bytes, computed while they stream in
+        self.sha256 = hashlib.sha256()
+        self._chunks = []
+        self._file = None
+        self._head = b""
+        self._header_checked = False
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        self.sha256.update(data)
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise HTTPException(status_code=413, detail=f"PDF exceeds the {self.max_bytes} byte upload limit")
+
+        # Reject non-PDF content as soon as the header window has arrived
+        if not self._header_checked:
+            self._head += data[:PDF_HEADER_WINDOW - len(self._head)]
+            if len(self._head) >= PDF_HEADER_WINDOW:
+                self._check_header()
+
+        if self._file is None and self.size > self.spool_bytes:
+            self._file = tempfile.NamedTemporaryFile(dir=UPLOAD_TMP_DIR, suffix=".pdf", delete=False)
+            self.path = self._file.name
+            for chunk in self._chunks:
+                self._file.write(chunk)
+            self._chunks = []
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            self._chunks.append(bytes(data))
+
+    def _check_header(self):
+        self._header_checked = True
+        if PDF_MAGIC not in self._head:
+            raise HTTPException(status_code=415, detail="Uploaded file is not a PDF")
+
+    def finish(self) -> Union[bytes, str]:
+        """
+        Complete the upload.
+
+        Returns:
+            The PDF as bytes when it fit in memory, otherwise the path of the
+            temporary file; both can be handed to fitz.open directly
+        """
+        if self.size == 0:
+            raise HTTPException(status_code=400, detail="Empty upload")
+        if not self._header_checked:
+            self._check_header()
+        if self._file is not None:
+            self._file.close()
+            return self.path
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+    def cleanup(self):
+        """Remove the temporary file, if the upload spilled to disk"""
+        if self._file is not None:
+            self._file.close()
+        if self.path:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+
+async def read_pdf_upload(request: Request, spool: Optional[SpooledPDF] = None) -> SpooledPDF:
+    """
+    Stream a PDF request body into a SpooledPDF.
+
+    Accepts either a raw application/pdf (or application/octet-stream) body or
+    a multipart/form-data body whose first file part is the PDF. The size cap
+    and PDF header are enforced while the body is still arriving.
+    """
+    spool = spool or SpooledPDF()
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > spool.max_bytes + MULTIPART_OVERHEAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"PDF exceeds the {spool.max_bytes} byte upload limit")
+
+    try:
+        if content_type == b"multipart/form-data":
+            boundary = params.get(b"boundary")
+            if not boundary:
+                raise HTTPException(status_code=400, detail="Missing multipart boundary")
+            def open_spool(filename):
+                # Only the first file part is read
+                if spool.filename is not None or spool.size:
+                    return None
+                spool.filename = filename
+                return spool
+
+            parser = _pdf_part_parser(boundary, open_spool)
+            async for chunk in request.stream():
+                parser.write(chunk)
+            parser.finalize()
+        elif content_type in PDF_CONTENT_TYPES:
+            async for chunk in request.stream():
+                spool.write(chunk)
+        else:
+            raise HTTPException(status_code=415, detail="Send the PDF as application/pdf or multipart/form-data")
+    except Exception:
+        spool.cleanup()
+        raise
+
+    return spool
+
+
+async def read_pdf_uploads(request: Request, max_files: int = MAX_BATCH_FILES) -> List[SpooledPDF]:
+    """
+    Stream every file part of a multipart/form-data body into its own
+    SpooledPDF. Each part is size-capped and header-checked as it arrives.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data":
+        raise HTTPException(status_code=415, detail="Send the PDFs as multipart/form-data")
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="Missing multipart boundary")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > max_files * (MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES):
+            raise HTTPException(status_code=413, detail="Batch exceeds the upload limit")
+
+    spools = []
+
+    def open_spool(filename):
+        if len(spools) >= max_files:
+            raise HTTPException(status_code=413, detail=f"At most {max_files} files per batch")
+        spool = SpooledPDF()
+        spool.filename = filename
+        spools.append(spool)
+        return spool
+
+    try:
+        parser = _pdf_part_parser(boundary, open_spool)
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+        if not spools:
+            raise HTTPException(status_code=400, detail="No PDF files in the upload")
+    except Exception:
+        for spool in spools:
+            spool.cleanup()
+        raise
+
+    return spools
+
+
+def _pdf_part_parser(boundary: bytes, open_spool: Callable[[Optional[str]], Optional[SpooledPDF]]) -> MultipartParser:
+    """
+    Multipart parser that writes the data of file parts into spools.
+
+    open_spool(filename) is called for each file part and returns the spool
+    to write it to, or None to skip the part.
+    """
+    state = {
+        "header_field": b"",
+        "header_value": b"",
+        "headers": {},
+        "spool": None
+    }
+
+    def on_part_begin():
+        state["headers"] = {}
+        state["spool"] = None
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        if b"filename" not in disposition:
+            return
+        spool = open_spool(disposition[b"filename"].decode("utf-8", "replace"))
+        if spool is None:
+            return
+        part_type, _ = parse_options_header(state["headers"].get(b"content-type", b"application/pdf"))
+        if part_type not in PDF_CONTENT_TYPES:
+            raise HTTPException(status_code=415, detail="Uploaded file is not a PDF")
+        state["spool"] = spool
+
+    def on_part_data(data, start, end):
+        if state["spool"] is not None:
+            state["spool"].write(data[start:end])
+
+    def on_part_end():
+        state["spool"] = None
+
+    callbacks = {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end
+    }
+    return MultipartParser(boundary, callbacks)
@@ -1,29 +1,142 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
 from dotenv import load_dotenv
-import os, json
+import os, json, re
+import asyncio
+import time
+from typing import List, Optional, Tuple
 from langchain.prompts import ChatPromptTemplate
 from prompt_templates import validation_prompt_template
+from llm_router import get_llm
+from llm_cache import uncached
+import metrics
 load_dotenv()
 
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Upper bound for a single LLM round trip
+LLM_CALL_TIMEOUT_SECONDS = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "60"))
 
-gemini = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    google_api_key=GEMINI_API_KEY,
-    temperature=0.7,
-    verbose=True
+# Test names the deterministic checker looks for, with the spellings and
+# abbreviations that count as the same test in the source
+TEST_NAME_SYNONYMS = {
+    "hemoglobin": ["hemoglobin", "haemoglobin", "hb", "hgb"],
+    "hematocrit": ["hematocrit", "haematocrit", "hct", "pcv", "packed cell volume"],
+    "red blood cells": ["red blood cell", "red blood cells", "rbc", "erythrocyte"],
+    "white blood cells": ["white blood cell", "white blood cells", "wbc", "leukocyte", "leucocyte", "tlc", "total leucocyte count"],
+    "platelets": ["platelet", "platelets", "plt", "thrombocyte"],
+    "mcv": ["mcv", "mean corpuscular volume", "mean cell volume"],
+    "mchc": ["mchc", "mean corpuscular hemoglobin concentration", "mean corpuscular haemoglobin concentration"],
+    "mch": ["mch", "mean corpuscular hemoglobin", "mean corpuscular haemoglobin"],
+    "rdw": ["rdw", "red cell distribution width"],
+    "mpv": ["mpv", "mean platelet volume"],
+    "neutrophils": ["neutrophil", "neutrophils", "polymorphs"],
+    "lymphocytes": ["lymphocyte", "lymphocytes"],
+    "monocytes": ["monocyte", "monocytes"],
+    "eosinophils": ["eosinophil", "eosinophils"],
+    "basophils": ["basophil", "basophils"],
+    "esr": ["esr", "erythrocyte sedimentation rate"]
+}
+
+UNIT_PATTERN = re.compile(
+    r"(?<![\w/])(g/dl|gm/dl|mg/dl|g/l|mmol/l|fl|pg|mm/hr|/cumm|cells/cumm|lakhs/cumm|mill/cumm|"
+    r"million/cumm|thou/mm3|mill/mm3|x10\^\d+/[ul]l?|10\^\d+/[ul]l?|/ul|%)(?![\w/])",
+    re.IGNORECASE
 )
+NUMBER_PATTERN = re.compile(r"(?<![\w.])\d+(?:,\d+)*(?:\.\d+)?")
 
-def validation_check(source_data: str, generated_summary: str) :
+def _numbers(text: str) -> set:
+    return {float(number.replace(",", "")) for number in NUMBER_PATTERN.findall(text)}
+
+def _mentions(term: str, text: str) -> bool:
+    return re.search(rf"(?<![a-z]){re.escape(term)}(?![a-z])", text) is not None
+
+def deterministic_check(source_data: str, generated_summary: str, structured_data: str = None) -> Tuple[Optional[bool], List[str]]:
+    """
+    Check locally that every number, unit and test name mentioned in the
+    summary appears in the source (or the structured data).
+
+    Returns:
+        (True, []) when everything checkable was confirmed, (None, []) when the
+        summary mentions nothing checkable, and (False, issues) otherwise
+    """
+    reference = (source_data or "") + "\n" + (structured_data or "")
+    reference_lower = reference.lower()
+    summary_lower = generated_summary.lower()
+    issues = []
+    checked = 0
+
+    reference_numbers = _numbers(reference)
+    for number in sorted(_numbers(generated_summary)):
+        checked += 1
+        if number not in reference_numbers:
+            issues.append(f"value {number:g} does not appear in the source")
+
+    reference_units = {unit.lower() for unit in UNIT_PATTERN.findall(reference)}
+    for unit in sorted({unit.lower() for unit in UNIT_PATTERN.findall(generated_summary)}):
+        checked += 1
+        if unit not in reference_units:
+            issues.append(f"unit {unit} does not appear in the source")
+
+    for test_name, synonyms in TEST_NAME_SYNONYMS.items():
+        if any(_mentions(synonym, summary_lower) for synonym in synonyms):
+            checked += 1
+            if not any(_mentions(synonym, reference_lower) for synonym in synonyms):
+                issues.append(f"test {test_name} does not appear in the source")
+
+    if issues:
+        return False, issues
+    if checked == 0:
+        return None, []
+    return True, []
+
+async def ainvoke_with_timeout(chain, inputs: dict, name: str, timeout: float = None):
+    """Await chain.ainvoke, raising TimeoutError if it takes longer than timeout seconds"""
+    timeout = timeout or LLM_CALL_TIMEOUT_SECONDS
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        result = await asyncio.wait_for(chain.ainvoke(inputs), timeout)
+        outcome = "ok"
+        return result
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise TimeoutError(f"{name} call timed out after {timeout:g}s") from None
+    finally:
+        # "Structuring chunk 3" is recorded as "structuring"
+        metrics.LLM_CALL_SECONDS.observe(time.perf_counter() - start, call=name.split()[0].lower(), outcome=outcome)
+
+async def astream_with_timeout(chain, inputs: dict, name: str, timeout: float = None):
+    """Yield the text chunks of chain.astream, raising TimeoutError if the whole stream takes longer than timeout seconds"""
+    timeout = timeout or LLM_CALL_TIMEOUT_SECONDS
+    start = time.perf_counter()
+    outcome = "error"
+    stream = chain.astream(inputs)
+    try:
+        while True:
+            remaining = max(timeout - (time.perf_counter() - start), 0)
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), remaining)
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                raise TimeoutError(f"{name} call timed out after {timeout:g}s") from None
+            if chunk.content:
+                yield chunk.content
+        outcome = "ok"
+    finally:
+        await stream.aclose()
+        metrics.LLM_CALL_SECONDS.observe(time.perf_counter() - start, call=name.split()[0].lower(), outcome=outcome)
+
+async def avalidation_check(source_data: str, generated_summary: str) :
     try:
         if source_data is None:
             raise ValueError
         
         validation_prompt = ChatPromptTemplate.from_template(validation_prompt_template(source_data, generated_summary))
-        validation_chain = validation_prompt | gemini
+        validation_chain = validation_prompt | get_llm()
 
-        validation_result = validation_chain.invoke({"source_data" : source_data, "generated_summary" : generated_summary})
+        # Verdicts are never cached, so a "No" is not replayed on the next upload
+        with uncached():
+            validation_result = await ainvoke_with_timeout(validation_chain, {"source_data" : source_data, "generated_summary" : generated_summary}, "Validation")
 
         if validation_result.content:
             return validation_result.content
@@ -32,6 +145,28 @@ def validation_check(source_data: str, generated_summary: str) :
     except Exception as e:
         print(e)
 
+async def avalidate_summary(source_data: str, generated_summary: str, structured_data: str = None) :
+    """
+    Validate a summary, running the deterministic check first.
+
+    Summaries whose values, units and test names are all confirmed locally
+    are accepted without an LLM call. Anything unconfirmed or flagged goes to
+    the LLM validator; local findings are appended to a failing critique so
+    the retry knows exactly what was wrong.
+    """
+    confirmed, issues = deterministic_check(source_data, generated_summary, structured_data)
+    if confirmed:
+        return "Yes, every value, unit and test name in the summary was found in the source data."
+
+    validation_result = await avalidation_check(source_data, generated_summary)
+    if validation_result is not None and issues and "yes" not in validation_result.lower():
+        validation_result += "\nDeterministic check: " + "; ".join(issues)
+    return validation_result
+
+def validation_check(source_data: str, generated_summary: str) :
+    """Blocking wrapper around avalidation_check for scripts outside the event loop"""
+    return asyncio.run(avalidation_check(source_data, generated_summary))
+
 
 if __name__ == "__main__":
     with open("data/generated_summary.txt", 'r') as file:
@@ -0,0 +1,135 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Optional
+import metrics
+
+# CPU-bound stages (PyMuPDF, spaCy) run in a bounded process pool so they do
+# not block the event loop; set CPU_EXECUTOR=thread to use threads instead
+CPU_EXECUTOR = os.getenv("CPU_EXECUTOR", "process").lower()
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Blocking I/O (LLM calls) runs in a bounded thread pool
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))
+
+# Per-stage timeouts in seconds
+EXTRACT_TIMEOUT_SECONDS = float(os.getenv("EXTRACT_TIMEOUT_SECONDS", "60"))
+DEIDENTIFY_TIMEOUT_SECONDS = float(os.getenv("DEIDENTIFY_TIMEOUT_SECONDS", "120"))
+SUMMARY_TIMEOUT_SECONDS = float(os.getenv("SUMMARY_TIMEOUT_SECONDS", "300"))
+
+_cpu_pool = None
+_io_pool = None
+_pool_lock = threading.Lock()
+
+# Module-level function each CPU worker process runs once when it starts
+# (see set_cpu_initializer)
+_cpu_initializer = None
+
+
+class WorkerError(Exception):
+    """Raised when a stage fails or times out in a worker"""
+
+
+def _call(func: Callable, args: tuple, kwargs: dict) -> Any:
+    """
+    Run func in the worker, re-raising failures as a picklable WorkerError.
+
+    Returns (result, metrics journal) so observations made in a worker
+    process reach the /metrics registry of the API process.
+    """
+    try:
+        return metrics.run_journaled(func, *args, **kwargs)
+    except Exception as e:
+        raise WorkerError(str(e)) from None
+
+
+def set_cpu_initializer(initializer: Optional[Callable[[], Any]]):
+    """
+    Run initializer (e.g. a model warm-up) in every CPU worker process as it
+    starts. Applies to pools created afterwards; has no effect with
+    CPU_EXECUTOR=thread, where workers share the API process.
+    """
+    global _cpu_initializer
+    _cpu_initializer = initializer
+
+
+def get_cpu_pool():
+    global _cpu_pool
+    with _pool_lock:
+        if _cpu_pool is None:
+            if CPU_EXECUTOR == "thread":
+                _cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+            else:
+                # spawn avoids forking a process that already runs threads
+                _cpu_pool = ProcessPoolExecutor(
+                    max_workers=CPU_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_cpu_initializer
+                )
+        return _cpu_pool
+
+
+def get_io_pool():
+    global _io_pool
+    with _pool_lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+        return _io_pool
+
+
+def _reset_cpu_pool(broken_pool):
+    """Drop a process pool whose worker died so the next call starts a fresh one"""
+    global _cpu_pool
+    with _pool_lock:
+        if _cpu_pool is broken_pool:
+            _cpu_pool = None
+    broken_pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _run(pool, func: Callable, args: tuple, kwargs: dict, timeout: Optional[float]) -> Any:
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(pool, partial(_call, func, args, kwargs))
+    try:
+        result, journal = await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        # A task that already started keeps running in its worker until it
+        # finishes; only the caller stops waiting for it
+        raise WorkerError(f"{func.__name__} timed out after {timeout:g}s") from None
+    metrics.replay(journal)
+    return result
+
+
+async def run_cpu(func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+    """
+    Run a CPU-bound function in the worker pool without blocking the event loop.
+
+    Args:
+        func: Module-level function (it is pickled when CPU_EXECUTOR=process)
+        timeout: Seconds to wait before raising WorkerError (None waits forever)
+    """
+    pool = get_cpu_pool()
+    try:
+        return await _run(pool, func, args, kwargs, timeout)
+    except BrokenProcessPool as e:
+        _reset_cpu_pool(pool)
+        raise WorkerError(f"{func.__name__} worker crashed: {str(e)}") from None
+
+
+async def run_io(func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+    """Run a blocking I/O function in the thread pool without blocking the event loop."""
+    return await _run(get_io_pool(), func, args, kwargs, timeout)
+
+
+def shutdown_executors():
+    global _cpu_pool, _io_pool
+    with _pool_lock:
+        pools = [_cpu_pool, _io_pool]
+        _cpu_pool = None
+        _io_pool = None
+    for pool in pools:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)